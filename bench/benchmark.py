@@ -0,0 +1,188 @@
+"""
+Synthetic scale benchmark for the submit and control paths. Every job count runs as an isolated scenario in its
+own process and prints one JSON object per line, e.g.:
+
+    python3 bench/benchmark.py 100 10000 1000000
+
+Measured are the provider package resolve times, the manifest write time, the per package script generation time,
+the submit wall time against a fake sbatch, the control script startup time per simulated rank and the mocassin
+completion scan on a generated job folder tree. The peak memory is the max RSS of the scenario process
+"""
+from typing import Callable, Dict, List, Tuple
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(f"{BENCH_DIR}/../src")
+MOCASSIN_DIR = f"{SRC_DIR}/impl/mocassin"
+sys.path[:0] = [SRC_DIR, MOCASSIN_DIR, BENCH_DIR]
+
+import arrayjob
+import provide_mocsim
+import provide_synthetic
+from provide import ProviderBase
+
+PACKAGE_SIZE = 48
+RANK_SAMPLES = 8
+MAX_SUBMITS = 1000
+
+TEMPLATE = """<ArrayJob>
+    <Control Script="control.py"/>
+    <Provide Script="provide_synthetic.py"/>
+    <Execute Script="{execute}"/>
+    <Submit Mode="single" Command="{python} {fake_sbatch}"/>
+    <Batch>
+        <Cookies Format="#SBATCH --{{}}={{}}" MpiProcessTag="ntasks">
+            <Cookie Tag="job-name" Value="bench_%J"/>
+            <Cookie Tag="time" Value="00:15:00"/>
+            <Cookie Tag="ntasks" Value="{package_size}"/>
+        </Cookies>
+        <Commands/>
+    </Batch>
+</ArrayJob>
+"""
+
+class FullListProvider(ProviderBase):
+    """
+    The synthetic provider without the count/range protocol to measure the fallback of the base class
+    """
+
+    def __init__(self, is_silent: bool) -> None:
+        super().__init__(is_silent)
+        self.synthetic = provide_synthetic.Provider(is_silent)
+
+    def get_all_execution_args(self, control_args: List[str]) -> List[List[str]]:
+        return self.synthetic.get_all_execution_args(control_args)
+
+    def get_all_execution_paths(self, control_args: List[str]) -> List[str]:
+        return self.synthetic.get_all_execution_paths(control_args)
+
+def timed(func: Callable) -> Tuple[object,float]:
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+def get_sample_packages(job_count: int, samples: int) -> List[int]:
+    package_count = -(-job_count // PACKAGE_SIZE)
+    return sorted(set(int(i * (package_count - 1) / max(1, samples - 1)) for i in range(0, samples)))
+
+def bench_provider(job_count: int) -> Dict:
+    control_args = [str(job_count)]
+    packages = get_sample_packages(job_count, 3)
+    lazy = provide_synthetic.Provider(True)
+    lazy_times = [timed(lambda: lazy.get_exe_args_by_package_id(control_args, PACKAGE_SIZE, x))[1] for x in packages]
+    fallback = FullListProvider(True)
+    fallback_times = [timed(lambda: fallback.get_exe_args_by_package_id(control_args, PACKAGE_SIZE, x))[1] for x in packages]
+    return {
+        "resolve_package_range_s": statistics.mean(lazy_times),
+        "resolve_package_fallback_first_s": fallback_times[0],
+        "resolve_package_fallback_cached_s": statistics.mean(fallback_times[1:]) if len(fallback_times) > 1 else fallback_times[0]}
+
+def bench_submit(job_count: int, work_dir: str) -> Dict:
+    template_path = f"{work_dir}/bench.xml"
+    with open(template_path, mode="w") as file:
+        file.write(TEMPLATE.format(
+            execute=f"{BENCH_DIR}/execute_noop.sh",
+            python=sys.executable,
+            fake_sbatch=f"{BENCH_DIR}/fake_sbatch.py",
+            package_size=PACKAGE_SIZE))
+
+    start = time.perf_counter()
+    job = arrayjob.ArrayJob(template_path, [str(job_count)])
+    _, manifest_time = timed(lambda: job.write_manifest(f"{work_dir}/bench.manifest"))
+    generate_times = []
+    submit_times = []
+    scripts = iter(job.generate_submit_scripts())
+    while True:
+        script, generate_time = timed(lambda: next(scripts, None))
+        if script is None:
+            break
+        generate_times.append(generate_time)
+        if len(submit_times) < MAX_SUBMITS:
+            submit_times.append(timed(lambda: script.submit(submit_command=job.submit_command))[1])
+
+    return {
+        "submit_wall_s": time.perf_counter() - start,
+        "manifest_write_s": manifest_time,
+        "packages": len(generate_times),
+        "submitted": len(submit_times),
+        "script_generate_mean_s": statistics.mean(generate_times),
+        "script_generate_max_s": max(generate_times),
+        "sbatch_call_mean_s": statistics.mean(submit_times)}
+
+def bench_control(job_count: int, work_dir: str) -> Dict:
+    env = dict(os.environ, PYTHONPATH=BENCH_DIR)
+    results = dict()
+    # Note: The options match the generated scripts of single rank packages, the provider bytecode is written with the manifest
+    cache_options = ["-providecache", f"{work_dir}/bench.provider.pyc"]
+    for name, options in (("manifest", ["-manifest", f"{work_dir}/bench.manifest"] + cache_options), ("provider", cache_options)):
+        times = []
+        for package_id in get_sample_packages(job_count, RANK_SAMPLES):
+            popen_args = [sys.executable, f"{SRC_DIR}/control.py", "-provide", "provide_synthetic.py",
+                "-execute", f"{BENCH_DIR}/execute_noop.sh", "-package", str(package_id), "-packsize", str(PACKAGE_SIZE), "-mpisize", "1"]
+            popen_args += options + ["-args", str(job_count)]
+            result, runtime = timed(lambda: subprocess.run(popen_args, env=env, stdout=subprocess.DEVNULL))
+            if result.returncode != 0:
+                raise Exception(f"The control script failed with returncode {result.returncode}")
+            times.append(runtime)
+        results[f"rank_startup_{name}_mean_s"] = statistics.mean(times)
+        results[f"rank_startup_{name}_max_s"] = max(times)
+
+    return results
+
+def create_mocassin_tree(job_count: int, work_dir: str) -> None:
+    # Note: Every second job is finished, the logs are padded so only a tail read finds the abort reason
+    padding = "x" * 4096 + "\n"
+    for i in range(1, job_count + 1):
+        os.mkdir(f"{work_dir}/Job{i:05d}")
+        with open(f"{work_dir}/Job{i:05d}/stdout.log", mode="w") as file:
+            file.write(padding + ("ABORT_REASON: benchmark\n" if i % 2 == 0 else ""))
+
+def bench_mocassin_scan(job_count: int, work_dir: str) -> Dict:
+    control_args = [f"{work_dir}/bench.msl", f"1-{job_count}"]
+    _, create_time = timed(lambda: create_mocassin_tree(job_count, work_dir))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, cold_time = timed(lambda: provide_mocsim.Provider(False).get_job_count(control_args))
+        _, warm_time = timed(lambda: provide_mocsim.Provider(False).get_job_count(control_args))
+
+    return {"scan_tree_create_s": create_time, "scan_cold_s": cold_time, "scan_warm_s": warm_time}
+
+def run_scenario(job_count: int) -> Dict:
+    work_dir = tempfile.mkdtemp(prefix="slurm-submit-bench-")
+    os.environ["FAKE_SBATCH_LOG"] = f"{work_dir}/fake_sbatch.jsonl"
+    os.chdir(work_dir)
+    try:
+        results = {"jobs": job_count, "package_size": PACKAGE_SIZE}
+        results.update(bench_provider(job_count))
+        results.update(bench_submit(job_count, work_dir))
+        results.update(bench_control(job_count, work_dir))
+        results.update(bench_mocassin_scan(job_count, work_dir))
+        # Note: ru_maxrss is given in KiB on Linux
+        results["peak_rss_kib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return results
+    finally:
+        os.chdir(BENCH_DIR)
+        shutil.rmtree(work_dir)
+
+def main(argv: List[str]) -> None:
+    if len(argv) == 2 and argv[0] == "-scenario":
+        print(json.dumps(run_scenario(int(argv[1]))), flush=True)
+        return
+
+    for job_count in [int(x) for x in argv] or [100, 1000, 10000]:
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "-scenario", str(job_count)], stdout=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise Exception(f"The benchmark scenario with {job_count} jobs failed")
+        print(result.stdout.strip(), flush=True)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
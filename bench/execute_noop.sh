@@ -0,0 +1,4 @@
+#!/usr/bin/env bash
+
+# Benchmark execute script that does no work
+exit 0
@@ -0,0 +1,25 @@
+"""
+Stand-in for 'sbatch' that records every submission as one JSON line in the file named by $FAKE_SBATCH_LOG and
+prints a job id like 'sbatch --parsable'. The script is read from the last argument or from stdin if that is no file
+"""
+import json
+import os
+import sys
+import time
+
+log_path = os.environ.get("FAKE_SBATCH_LOG", "fake_sbatch.jsonl")
+flags = [x for x in sys.argv[1:] if x.startswith("-")]
+files = [x for x in sys.argv[1:] if not x.startswith("-")]
+if len(files) > 0 and os.path.isfile(files[-1]):
+    with open(files[-1]) as file: content = file.read()
+else:
+    content = sys.stdin.read()
+
+job_id = 1
+if os.path.exists(log_path):
+    with open(log_path) as file: job_id += sum(1 for _ in file)
+
+with open(log_path, mode="a") as file:
+    file.write(json.dumps({"job_id": job_id, "time": time.time(), "flags": flags, "script": content}) + "\n")
+
+print(job_id, flush=True)
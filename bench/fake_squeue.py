@@ -0,0 +1,16 @@
+"""
+Stand-in for 'squeue' that prints the ids of all jobs recorded by the fake sbatch in $FAKE_SBATCH_LOG which were
+submitted less than $FAKE_SQUEUE_RUNTIME seconds ago, i.e. every fake job stays in the queue for that long
+"""
+import json
+import os
+import time
+
+log_path = os.environ.get("FAKE_SBATCH_LOG", "fake_sbatch.jsonl")
+runtime = float(os.environ.get("FAKE_SQUEUE_RUNTIME", "5"))
+if os.path.exists(log_path):
+    with open(log_path) as file:
+        for line in file:
+            record = json.loads(line)
+            if time.time() - record["time"] < runtime:
+                print(record["job_id"])
@@ -0,0 +1,31 @@
+from typing import List
+from provide import ProviderBase
+
+class Provider(ProviderBase):
+    """
+    A synthetic provider for benchmarks. The first control argument is the number of jobs, all further control
+    arguments are passed to every job. Implements the count/range protocol so no full job list is ever built
+    """
+
+    def __init__(self, is_silent: bool) -> None:
+        super().__init__(is_silent)
+
+    def get_all_execution_args(self, control_args: List[str]) -> List[List[str]]:
+        return self.get_execution_args_range(control_args, 0, self.get_job_count(control_args))
+
+    def get_all_execution_paths(self, control_args: List[str]) -> List[str]:
+        return self.get_execution_paths_range(control_args, 0, self.get_job_count(control_args))
+
+    def get_job_count(self, control_args: List[str]) -> int:
+        if len(control_args) < 1:
+            raise Exception("The synthetic provider expects the number of jobs as first control argument")
+
+        return int(control_args[0])
+
+    def get_execution_args_range(self, control_args: List[str], start: int, stop: int) -> List[List[str]]:
+        stop = min(stop, self.get_job_count(control_args))
+        return [["-jobId", str(i)] + control_args[1:] for i in range(start, stop)]
+
+    def get_execution_paths_range(self, control_args: List[str], start: int, stop: int) -> List[str]:
+        stop = min(stop, self.get_job_count(control_args))
+        return [f"./Job{i:07d}" for i in range(start, stop)]
@@ -1,24 +1,86 @@
-from typing import Iterable, List, Tuple, Union
+from typing import Dict, Iterable, List, Set, Tuple, Union
 import xml.etree.ElementTree as xml
+import math
 import os
-import uuid
+import shlex
+import subprocess
 
 from provide import ProviderBase
+from manifest import JobManifest
+from history import JobHistory
+from journal import CompletionJournal
+from loader import compile_provider, load_provider
 
 class JobScript:
+
+    # Note: NUL cannot occur in XML or command arguments, so the placeholder never collides with real content
+    PACKAGE_PLACEHOLDER: str = "\0PACKAGE\0"
+    OFFSET_PLACEHOLDER: str = "\0OFFSET\0"
     
-    def __init__(self, content: str) -> None:
-        self.file_path: str = f"./{uuid.uuid4()}.sh"
+    def __init__(self, content: str, submit_flags: List[str] = [], name: str = "package") -> None:
+        self.file_path: Union[str,None] = None
         self.content: str = content
+        self.submit_flags: List[str] = submit_flags.copy()
+        self.name: str = name
 
     def __str__(self) -> str:
         return f"Script:\n{self.content}"
+
+    def write(self, directory: str) -> None:
+        """
+        Writes the script into the directory. A written script is submitted by its path instead of via stdin
+        """
+        self.file_path = f"{directory}/{self.name}.sh"
+        with open(self.file_path, mode="w") as file: file.write(self.content)
     
-    def submit(self, auto_delete: bool = True, submit_format: str = r"sbatch {}") -> None:
-        with open(self.file_path, mode= "x") as file: file.write(self.content)
-        submit_command = submit_format.format(self.file_path)
-        os.system(submit_command)
-        if auto_delete: os.remove(self.file_path)
+    def submit(self, submit_command: List[str] = ["sbatch"]) -> str:
+        """
+        Submits the script with the given submit command and returns the job id reported by '--parsable'. The script
+        content is passed on stdin unless the script has been written to a file before
+        """
+        popen_args = self.get_submit_args(submit_command)
+        result = subprocess.run(popen_args, input=self.get_submit_input(), stdout=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise Exception(f"The submit command ({' '.join(popen_args)}) failed with returncode {result.returncode}")
+
+        return self.parse_job_id(result.stdout)
+
+    def get_submit_args(self, submit_command: List[str]) -> List[str]:
+        popen_args = submit_command + ["--parsable"] + self.submit_flags
+        return popen_args + [self.file_path] if self.file_path is not None else popen_args
+
+    def get_submit_input(self) -> Union[str,None]:
+        return self.content if self.file_path is None else None
+
+    @classmethod
+    def parse_job_id(cls, output: str) -> str:
+        # Note: The parsable output format is '<job id>[;<cluster name>]'
+        return output.strip().split(";")[0]
+
+    @classmethod
+    def write_all(cls, scripts: Iterable["JobScript"], directory: str) -> List["JobScript"]:
+        """
+        Writes all scripts into the directory in a single pass before any of them is submitted
+        """
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        for script in scripts:
+            script.write(directory)
+            written.append(script)
+
+        return written
+
+    @classmethod
+    def compile_content(cls, content: str) -> List[str]:
+        """
+        Splits a script content that was generated with the package placeholder into the constant parts around it
+        """
+        return content.split(cls.PACKAGE_PLACEHOLDER)
+
+    @classmethod
+    def render_content(cls, parts: List[str], package_id: Union[int,str], offset: Union[int,None] = None) -> str:
+        content = str(package_id).join(parts)
+        return content if offset is None else content.replace(cls.OFFSET_PLACEHOLDER, str(offset))
 
     @classmethod
     def sub_template_var(cls, template: str, var_name: str, data: Union[List[str],str], data_sep: str = "\n") -> str:
@@ -27,7 +89,7 @@ class JobScript:
 
     @classmethod
     def get_raw_script_template(cls) -> str:
-        return "#!/usr/bin/env zsh\n\n__COOKIES__\n\n__COMMANDS__\n\n__MPIEXEC__python3 __CONTROL__ -provide __PROVIDE__ -execute __EXECUTE__ -package __PACKAGE__ -packsize __PACKSIZE__ -args __ARGS__"
+        return "#!/usr/bin/env zsh\n\n__COOKIES__\n\n__COMMANDS__\n\n__MPIEXEC__python3 __CONTROL__ -provide __PROVIDE__ -execute __EXECUTE__ -package __PACKAGE__ -packsize __PACKSIZE__ __OPTIONS__-args __ARGS__"
 
     @classmethod
     def get_mpi_replacement(cls, mpisize: int) -> str:
@@ -37,7 +99,14 @@ class JobScript:
             return ""
 
     @classmethod
-    def generate_content(cls, execute: str, provide: str, control: str, package_id: int, mpisize: int, packsize: int, cookie_format: str, cookies: List[Tuple[str,str]], commands: List[str], args: List[str]) -> str: 
+    def get_options_replacement(cls, options: List[str]) -> str:
+        if len(options) > 0:
+            return " ".join(options) + " "
+        else:
+            return ""
+
+    @classmethod
+    def generate_content(cls, execute: str, provide: str, control: str, package_id: Union[int,str], mpisize: int, packsize: int, cookie_format: str, cookies: List[Tuple[str,str]], commands: List[str], args: List[str], options: List[str] = []) -> str: 
         template = cls.get_raw_script_template()
         template = cls.sub_template_var(template, "PROVIDE", provide)
         template = cls.sub_template_var(template, "EXECUTE", execute)
@@ -46,6 +115,7 @@ class JobScript:
         template = cls.sub_template_var(template, "PACKSIZE", str(packsize))
         template = cls.sub_template_var(template, "MPIEXEC", cls.get_mpi_replacement(mpisize))
         template = cls.sub_template_var(template, "COOKIES", [cookie_format.format(x[0], x[1]) for x in cookies])
+        template = cls.sub_template_var(template, "OPTIONS", cls.get_options_replacement(options))
         template = cls.sub_template_var(template, "ARGS", args, " ")
 
         # Note: This gives the batch submit system the absolute path to the control script
@@ -63,9 +133,40 @@ class ArrayJob:
         self.provide_script: str = ""
         self.control_script: str = ""
         self.execute_script: str = ""
+        self.execute_mode: str = "subprocess"
+        self.preload_modules: List[str] = []
+        self.control_resolve: str = "rank"
+        self.package_size: int = 0
+        self.jobs_per_rank: int = 1
+        self.cores_per_node: Union[int,None] = None
+        self.threads_per_job: int = 1
+        self.package_dispatch: str = "static"
+        self.package_packing: str = "index"
+        self.time_tag: str = "time"
+        self.time_factor: float = 1.5
+        self.timing_directory: Union[str,None] = None
+        self.journal_directory: Union[str,None] = None
+        self.completed_paths: Union[Set[str],None] = None
+        self.stage_directory: Union[str,None] = None
+        self.packing: Union[Tuple[List[int],List[Union[float,None]]],None] = None
+        self.compiled_templates: Dict[Tuple[int,Tuple[Tuple[str,str],...]],List[str]] = dict()
+        self.submit_mode: str = "single"
+        self.submit_throttle: int = 0
+        self.submit_command: List[str] = ["sbatch"]
+        self.script_directory: Union[str,None] = None
+        self.queue_command: List[str] = ["squeue"]
+        self.max_queued: int = 100
+        self.poll_interval: float = 60.0
+        self.state_path: str = ""
+        self.manifest_count: Union[int,None] = None
+        self.manifest_reused: bool = False
+        self.provider_cache_path: Union[str,None] = None
         self.batch_cookies: List[Tuple[str,str]] = []
         self.cookie_format: str = ""
         self.submit_commands: List[str] = []
+        self.manifest_path: Union[str,None] = None
+        self.provider: Union[ProviderBase,None] = None
+        self.campaigns: List["ArrayJob"] = []
         self._load_template_data()
 
     def __str__(self) -> str:
@@ -82,6 +183,42 @@ class ArrayJob:
 
         return script_path
 
+    def _get_optional_attribute(self, xml_root: xml.Element, element_name: str, attribute: str, default: str) -> str:
+        node = xml_root.find(element_name)
+        if node is None:
+            return default
+
+        return node.get(attribute, default)
+
+    def _get_control_resolve(self, xml_root: xml.Element) -> str:
+        value = self._get_optional_attribute(xml_root, "Control", "Resolve", "rank")
+        if value not in ("rank", "scatter"):
+            raise Exception(f"The 'Resolve' value ({value}) of the 'Control' element is not supported")
+
+        return value
+
+    def _get_execute_mode(self, xml_root: xml.Element) -> str:
+        value = self._get_optional_attribute(xml_root, "Execute", "Mode", "subprocess")
+        if value not in ("subprocess", "inprocess"):
+            raise Exception(f"The 'Mode' value ({value}) of the 'Execute' element is not supported")
+        if value == "inprocess" and os.path.splitext(self.execute_script)[1] != ".py":
+            raise Exception("The 'inprocess' execute mode requires a python (.py) execute script")
+        # Note: In-process jobs share the interpreter state and cannot run concurrently on one rank
+        if value == "inprocess" and self._get_jobs_per_rank(xml_root) > 1:
+            raise Exception("The 'inprocess' execute mode does not support more than one job per rank")
+
+        return value
+
+    def _get_preload_modules(self, xml_root: xml.Element) -> List[str]:
+        node = xml_root.find("Execute")
+        modules = [x.get("Module") for x in node.findall("Preload")] if node is not None else []
+        if any(map(lambda x: x is None or x == "" or "," in x, modules)):
+            raise Exception("One of the 'Preload' elements has a missing or invalid 'Module' attribute")
+        if len(modules) > 0 and self.execute_mode != "inprocess":
+            raise Exception("The 'Preload' elements require the 'inprocess' execute mode")
+
+        return modules
+
     def _get_batch_node(self, xml_root: xml.Element) -> xml.Element:
         node = xml_root.find("Batch")
         if node is None:
@@ -142,6 +279,179 @@ class ArrayJob:
 
         return mpisize
 
+    def _get_package_dispatch(self, xml_root: xml.Element) -> str:
+        value = self._get_optional_attribute(xml_root, "Package", "Dispatch", "static")
+        if value not in ("static", "dynamic"):
+            raise Exception(f"The 'Dispatch' value ({value}) of the 'Package' element is not supported")
+
+        return value
+
+    def _get_jobs_per_rank(self, xml_root: xml.Element) -> int:
+        value = self._get_optional_attribute(xml_root, "Package", "JobsPerRank", "1")
+        count = 0
+        try: count = int(value)
+        except: raise Exception(f"The jobs per rank value ({value}) is not an integer")
+        if count < 1:
+            raise Exception("The jobs per rank value must be a positive integer: n > 0")
+
+        return count
+
+    def _get_package_size(self, xml_root: xml.Element) -> int:
+        worker_count = self.mpi_size * self.jobs_per_rank
+        value = self._get_optional_attribute(xml_root, "Package", "Size", str(worker_count))
+        size = 0
+        try: size = int(value)
+        except: raise Exception(f"The package size ({value}) is not an integer")
+        if self.package_dispatch == "static" and size != worker_count:
+            raise Exception("The package size must equal the mpi size times the jobs per rank unless jobs are dispatched dynamically")
+        if size < worker_count:
+            raise Exception("The package size cannot be smaller than the mpi size times the jobs per rank")
+
+        return size
+
+    def _get_threads_per_job(self, xml_root: xml.Element) -> int:
+        value = self._get_optional_attribute(xml_root, "Package", "ThreadsPerJob", "1")
+        count = 0
+        try: count = int(value)
+        except: raise Exception(f"The threads per job value ({value}) is not an integer")
+        if count < 1:
+            raise Exception("The threads per job value must be a positive integer: n > 0")
+
+        return count
+
+    def _get_cores_per_node(self, xml_root: xml.Element) -> Union[int,None]:
+        value = self._get_optional_attribute(xml_root, "Package", "CoresPerNode", "")
+        if value == "":
+            return None
+
+        count = 0
+        try: count = int(value)
+        except: raise Exception(f"The cores per node value ({value}) is not an integer")
+        ranks_per_node = count // (self.threads_per_job * self.jobs_per_rank)
+        if ranks_per_node < 1:
+            raise Exception(f"A node with {count} cores cannot hold a rank of {self.jobs_per_rank} jobs with {self.threads_per_job} threads")
+        if self.mpi_size % ranks_per_node != 0 or self.package_size % (ranks_per_node * self.jobs_per_rank) != 0:
+            raise Exception(f"The mpi size and the package size must fill whole nodes of {ranks_per_node} ranks")
+
+        return count
+
+    def _get_package_packing(self, xml_root: xml.Element) -> str:
+        value = self._get_optional_attribute(xml_root, "Package", "Packing", "index")
+        if value not in ("index", "runtime"):
+            raise Exception(f"The 'Packing' value ({value}) of the 'Package' element is not supported")
+        if value == "runtime" and self.journal_directory is None:
+            raise Exception("The 'runtime' packing requires a 'Journal' element that records the job runtimes")
+
+        return value
+
+    def _get_time_factor(self, xml_root: xml.Element) -> float:
+        value = self._get_optional_attribute(xml_root, "Package", "TimeFactor", "1.5")
+        factor = 0.0
+        try: factor = float(value)
+        except: raise Exception(f"The time factor ({value}) is not a number")
+        if factor < 1.0:
+            raise Exception("The time factor cannot be smaller than 1")
+
+        return factor
+
+    def _get_timing_directory(self, xml_root: xml.Element) -> Union[str,None]:
+        node = xml_root.find("Timing")
+        if node is None:
+            return None
+
+        directory = node.get("Directory")
+        if directory is None:
+            raise Exception("The 'Timing' element does not define a 'Directory' attribute")
+
+        return os.path.abspath(os.path.expandvars(directory))
+
+    def _get_journal_directory(self, xml_root: xml.Element) -> Union[str,None]:
+        node = xml_root.find("Journal")
+        if node is None:
+            return None
+
+        directory = node.get("Directory")
+        if directory is None:
+            raise Exception("The 'Journal' element does not define a 'Directory' attribute")
+
+        return os.path.abspath(os.path.expandvars(directory))
+
+    def _get_stage_directory(self, xml_root: xml.Element) -> Union[str,None]:
+        node = xml_root.find("Stage")
+        if node is None:
+            return None
+
+        # Note: The directory is expanded on the compute node, e.g. '$TMPDIR' is only defined within the batch job
+        directory = node.get("Directory")
+        if directory is None:
+            raise Exception("The 'Stage' element does not define a 'Directory' attribute")
+
+        return directory
+
+    def _get_submit_mode(self, xml_root: xml.Element) -> str:
+        value = self._get_optional_attribute(xml_root, "Submit", "Mode", "single")
+        if value not in ("single", "array", "stream"):
+            raise Exception(f"The 'Mode' value ({value}) of the 'Submit' element is not supported")
+
+        return value
+
+    def _get_submit_throttle(self, xml_root: xml.Element) -> int:
+        value = self._get_optional_attribute(xml_root, "Submit", "Throttle", "0")
+        throttle = 0
+        try: throttle = int(value)
+        except: raise Exception(f"The submit throttle ({value}) is not an integer")
+        if throttle < 0:
+            raise Exception("The submit throttle cannot be negative")
+
+        return throttle
+
+    def _get_submit_command(self, xml_root: xml.Element) -> List[str]:
+        value = self._get_optional_attribute(xml_root, "Submit", "Command", "sbatch")
+        command = shlex.split(os.path.expandvars(value))
+        if len(command) == 0:
+            raise Exception("The 'Command' value of the 'Submit' element is empty")
+
+        return command
+
+    def _get_script_directory(self, xml_root: xml.Element) -> Union[str,None]:
+        value = self._get_optional_attribute(xml_root, "Submit", "ScriptDirectory", "")
+        if value == "":
+            return None
+
+        return os.path.abspath(os.path.expandvars(value))
+
+    def _get_queue_command(self, xml_root: xml.Element) -> List[str]:
+        value = self._get_optional_attribute(xml_root, "Submit", "QueueCommand", "squeue")
+        command = shlex.split(os.path.expandvars(value))
+        if len(command) == 0:
+            raise Exception("The 'QueueCommand' value of the 'Submit' element is empty")
+
+        return command
+
+    def _get_max_queued(self, xml_root: xml.Element) -> int:
+        value = self._get_optional_attribute(xml_root, "Submit", "MaxQueued", "100")
+        max_queued = 0
+        try: max_queued = int(value)
+        except: raise Exception(f"The max queued value ({value}) is not an integer")
+        if max_queued < 1:
+            raise Exception("The max queued value must be a positive integer: n > 0")
+
+        return max_queued
+
+    def _get_poll_interval(self, xml_root: xml.Element) -> float:
+        value = self._get_optional_attribute(xml_root, "Submit", "PollInterval", "60")
+        interval = 0.0
+        try: interval = float(value)
+        except: raise Exception(f"The poll interval ({value}) is not a number")
+        if interval <= 0:
+            raise Exception("The poll interval must be positive")
+
+        return interval
+
+    def _get_state_path(self, xml_root: xml.Element) -> str:
+        value = self._get_optional_attribute(xml_root, "Submit", "StateFile", "submit_state.json")
+        return os.path.abspath(os.path.expandvars(value))
+
     def _get_submit_commands(self, xml_root: xml.Element) -> List[str]:
         node = self._get_commands_node(xml_root)
         commands = [x.get("Value") for x in node.findall("Command")]
@@ -152,8 +462,11 @@ class ArrayJob:
 
     def _load_script_data(self, xml_root: xml.Element) -> None:
         self.control_script = self._get_script_data(xml_root, "Control")
+        self.control_resolve = self._get_control_resolve(xml_root)
         self.provide_script = self._get_script_data(xml_root, "Provide")
         self.execute_script = self._get_script_data(xml_root, "Execute")
+        self.execute_mode = self._get_execute_mode(xml_root)
+        self.preload_modules = self._get_preload_modules(xml_root)
 
     def _load_batch_data(self, xml_root: xml.Element) -> None:
         self.cookie_format = self._get_batch_cookie_format(xml_root)
@@ -162,12 +475,51 @@ class ArrayJob:
         self.mpi_tag = self._get_mpi_tag(xml_root)
         self.mpi_size = self._get_mpi_size()
 
+    def _load_package_data(self, xml_root: xml.Element) -> None:
+        self.timing_directory = self._get_timing_directory(xml_root)
+        self.journal_directory = self._get_journal_directory(xml_root)
+        self.stage_directory = self._get_stage_directory(xml_root)
+        self.package_dispatch = self._get_package_dispatch(xml_root)
+        self.jobs_per_rank = self._get_jobs_per_rank(xml_root)
+        self.package_size = self._get_package_size(xml_root)
+        self.package_packing = self._get_package_packing(xml_root)
+        self.time_factor = self._get_time_factor(xml_root)
+        self.threads_per_job = self._get_threads_per_job(xml_root)
+        self.cores_per_node = self._get_cores_per_node(xml_root)
+        self._load_node_shape_data()
+
+    def _load_node_shape_data(self) -> None:
+        """
+        Sets the cpus per task, the thread count of the jobs and the tasks per node of a template that defines its
+        thread or node shape. Cookies with the same tag are replaced
+        """
+        cookies: List[Tuple[str,str]] = []
+        if self.threads_per_job > 1 or self.cores_per_node is not None:
+            cookies.append(("cpus-per-task", str(self.threads_per_job * self.jobs_per_rank)))
+            self.submit_commands = self.submit_commands + [f"export OMP_NUM_THREADS={self.threads_per_job}"]
+        if self.cores_per_node is not None:
+            cookies.extend([("ntasks-per-node", str(self.get_ranks_per_node())), ("nodes", "1")])
+
+        tags = set(x[0] for x in cookies)
+        self.batch_cookies = [x for x in self.batch_cookies if x[0] not in tags] + cookies
+
+    def _load_submit_data(self, xml_root: xml.Element) -> None:
+        self.submit_mode = self._get_submit_mode(xml_root)
+        self.submit_throttle = self._get_submit_throttle(xml_root)
+        self.submit_command = self._get_submit_command(xml_root)
+        self.script_directory = self._get_script_directory(xml_root)
+        self.queue_command = self._get_queue_command(xml_root)
+        self.max_queued = self._get_max_queued(xml_root)
+        self.poll_interval = self._get_poll_interval(xml_root)
+        self.state_path = self._get_state_path(xml_root)
+
     def _load_template_data(self) -> None:
         xml_tree = xml.parse(self.template_path)
         xml_root = xml_tree.getroot()
         self._load_script_data(xml_root)
         self._load_batch_data(xml_root)
-        pass
+        self._load_package_data(xml_root)
+        self._load_submit_data(xml_root)
 
     def overwrite_mpi_size(self, mpi_size: int):
         if mpi_size < 1:
@@ -179,39 +531,364 @@ class ArrayJob:
 
         self.mpi_size = mpi_size
 
-    def generate_script(self, package_id: int, mpi_size_overwrite: Union[int,None] = None) -> JobScript:
+    def get_control_options(self) -> List[str]:
+        options = ["-mpisize", str(self.mpi_size)]
+        if self.manifest_path is not None:
+            options.extend(["-manifest", os.path.abspath(self.manifest_path)])
+        if self.provider_cache_path is not None:
+            options.extend(["-providecache", os.path.abspath(self.provider_cache_path)])
+        if self.control_resolve == "scatter":
+            options.append("-scatter")
+        if self.package_dispatch == "dynamic":
+            options.append("-dispatch")
+        if self.jobs_per_rank > 1:
+            options.extend(["-jobsperrank", str(self.jobs_per_rank)])
+        if self.timing_directory is not None:
+            options.extend(["-timing", self.timing_directory])
+        if self.stage_directory is not None:
+            options.extend(["-stage", shlex.quote(self.stage_directory)])
+        if self.execute_mode == "inprocess":
+            options.append("-inprocess")
+        if len(self.preload_modules) > 0:
+            options.extend(["-preload", ",".join(self.preload_modules)])
+        if self.journal_directory is not None:
+            options.extend(["-journal", self.journal_directory])
+        if self.is_manifest_required():
+            options.append("-requiremanifest")
+
+        return options
+
+    def ensure_output_directories_created(self) -> None:
+        """
+        Creates the directories the control ranks write into. Called by the script generators, so every submit mode,
+        including stream submits, creates them before the first package is submitted
+        """
+        for directory in (self.timing_directory, self.journal_directory):
+            if directory is not None:
+                os.makedirs(directory, exist_ok=True)
+
+    def get_compiled_template(self, mpi_size: int, cookie_overrides: List[Tuple[str,str]], package_size: int, has_offset: bool = False) -> List[str]:
+        """
+        Get the script template with everything but the package id and offset substituted. Templates are compiled
+        once per MPI size, package size and cookie overrides, so rendering a package script is a single join
+        """
+        key = (mpi_size, package_size, has_offset, tuple(cookie_overrides))
+        if self.compiled_templates.get(key) is None:
+            mpi_size_old = self.mpi_size
+            self.overwrite_mpi_size(mpi_size)
+            overrides = dict(cookie_overrides)
+            cookies = [(x[0], overrides.get(x[0], x[1])) for x in self.batch_cookies]
+
+            script_content = JobScript.generate_content(
+                execute=self.execute_script,
+                provide=self.provide_script,
+                control=self.control_script,
+                package_id=JobScript.PACKAGE_PLACEHOLDER,
+                mpisize=self.mpi_size,
+                packsize=package_size,
+                cookie_format=self.cookie_format,
+                cookies=cookies,
+                commands=self.submit_commands,
+                args=self.submit_args,
+                options=self.get_control_options() + (["-offset", JobScript.OFFSET_PLACEHOLDER] if has_offset else []))
+
+            self.overwrite_mpi_size(mpi_size_old)
+            self.compiled_templates[key] = JobScript.compile_content(script_content)
+
+        return self.compiled_templates[key]
+
+    def generate_script(self, package_id: Union[int,str], mpi_size_overwrite: Union[int,None] = None, submit_flags: List[str] = [], cookie_overrides: List[Tuple[str,str]] = [], package_size: Union[int,None] = None, offset: Union[int,None] = None) -> JobScript:
+        """
+        Generates the script of a package. Packages of varying size define their size and the index of their first job
+        """
         if mpi_size_overwrite is not None and mpi_size_overwrite < 1:
             raise Exception("MPI size override cannot be smaller than 1")
 
-        mpi_size_old = self.mpi_size
-        self.overwrite_mpi_size(self.mpi_size if mpi_size_overwrite is None else mpi_size_overwrite)
+        mpi_size = self.mpi_size if mpi_size_overwrite is None else mpi_size_overwrite
+        package_size = self.package_size if package_size is None else package_size
+        cookie_overrides = self.get_node_cookie_overrides(mpi_size) + cookie_overrides
+        parts = self.get_compiled_template(mpi_size, cookie_overrides, package_size, offset is not None)
+        return JobScript(JobScript.render_content(parts, package_id, offset), submit_flags, self.get_script_name(package_id))
+
+    def get_script_name(self, package_id: Union[int,str]) -> str:
+        """
+        Get the name of a package script. The name starts with the name of the manifest, which is unique per submit
+        run, so campaigns and runs that keep their scripts in the same directory do not overwrite each other
+        """
+        name = f"package_{package_id:05d}" if isinstance(package_id, int) else "package_array"
+        if self.manifest_path is None:
+            return name
 
-        script_content = JobScript.generate_content(
-            execute=self.execute_script,
-            provide=self.provide_script,
-            control=self.control_script,
-            package_id=package_id,
-            mpisize=self.mpi_size,
-            packsize=mpi_size_old,
-            cookie_format=self.cookie_format,
-            cookies=self.batch_cookies,
-            commands=self.submit_commands,
-            args=self.submit_args)
+        return f"{os.path.splitext(os.path.basename(self.manifest_path))[0]}_{name}"
 
-        self.overwrite_mpi_size(mpi_size_old)
-        return JobScript(script_content)
+    @classmethod
+    def parse_time_limit(cls, value: str) -> int:
+        """
+        Converts a SLURM time limit ('MM', 'MM:SS', 'HH:MM:SS', 'D-HH', 'D-HH:MM', 'D-HH:MM:SS') into seconds
+        """
+        days, _, clock = value.rpartition("-")
+        parts = [int(x) for x in clock.split(":")]
+        if days != "":
+            parts = (parts + [0, 0])[:3]
+            return int(days) * 86400 + parts[0] * 3600 + parts[1] * 60 + parts[2]
+        if len(parts) == 3:
+            return parts[0] * 3600 + parts[1] * 60 + parts[2]
+        if len(parts) == 2:
+            return parts[0] * 60 + parts[1]
+
+        return parts[0] * 60
+
+    @classmethod
+    def format_time_limit(cls, seconds: int) -> str:
+        return f"{seconds // 86400}-{(seconds % 86400) // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+    def get_packing(self) -> Tuple[List[int],List[Union[float,None]]]:
+        """
+        Get the job index order and the runtimes of successful runs in that order for the runtime packing. Jobs are
+        sorted by descending predicted runtime, including the lower bounds of failed runs, so that packages hold jobs
+        of similar length. Jobs that never ran come first
+        """
+        if self.packing is None:
+            provider = self.get_provider()
+            count = provider.get_job_count(self.submit_args)
+            job_paths = provider.get_execution_paths_range(self.submit_args, 0, count)
+            history = JobHistory(self.journal_directory)
+            predicted = history.get_predicted_runtimes(job_paths)
+            successful = history.get_predicted_runtimes(job_paths, is_successful_only=True)
+            order = sorted(range(count), key=lambda i: -predicted[i] if predicted[i] is not None else -math.inf)
+            order = [i for i in order if not self.is_completed(job_paths[i])]
+            self.packing = (order, [successful[i] for i in order])
+
+        return self.packing
+
+    def get_time_limit_overrides(self, start: int, stop: int) -> List[Tuple[str,str]]:
+        """
+        Get the time limit cookie override for the jobs in the packed range [start, stop). The limit is the longest
+        successful runtime multiplied by the time factor plus one minute, capped by the template time limit. Packages
+        with a job without a successful run keep the template limit
+        """
+        time_value = next((x[1] for x in self.batch_cookies if x[0] == self.time_tag), None)
+        if self.package_packing != "runtime" or time_value is None:
+            return []
+
+        # Note: The predicted runtimes do not match the order of a reused manifest, so its packages keep the template limit
+        if self.manifest_reused:
+            return []
+
+        _, runtimes = self.get_packing()
+        if any(map(lambda x: x is None, runtimes[start:stop])):
+            return []
+
+        max_seconds = self.parse_time_limit(time_value)
+        seconds = int(math.ceil(max(runtimes[start:stop]) * self.time_factor)) + 60
+        return [(self.time_tag, self.format_time_limit(min(seconds, max_seconds)))]
+
+    def get_merge_key(self) -> Union[Tuple,None]:
+        """
+        Get the key of everything that ends up in the package scripts besides the campaign scripts and args. Jobs of
+        campaigns with the same key can share packages. Returns None if the campaign cannot be merged
+        """
+        if self.submit_mode == "stream" or self.package_packing == "runtime" or self.stage_directory is not None:
+            return None
+
+        return (self.control_script, self.cookie_format, tuple(self.batch_cookies), tuple(self.submit_commands),
+            self.mpi_tag, self.mpi_size, self.package_size, self.jobs_per_rank, self.package_dispatch, self.cores_per_node, self.threads_per_job,
+            self.execute_mode, tuple(self.preload_modules), self.timing_directory, self.journal_directory,
+            self.submit_mode, self.submit_throttle, tuple(self.submit_command), self.script_directory)
+
+    def merge(self, other: "ArrayJob") -> None:
+        """
+        Appends the jobs of another campaign behind the jobs of this one, so packages are filled across the campaign
+        boundary. The merged jobs are only defined by the manifest, which stores the execute script of each job
+        """
+        if self.get_merge_key() is None or self.get_merge_key() != other.get_merge_key():
+            raise Exception(f"The campaign ({other.template_path}) does not have the batch and package settings of ({self.template_path})")
+
+        self.campaigns.append(other)
+        self.manifest_path = None
+        self.manifest_count = None
+        self.manifest_reused = False
+        self.provider_cache_path = None
+        self.compiled_templates.clear()
+
+    def get_completed_paths(self) -> Set[str]:
+        if self.completed_paths is None:
+            self.completed_paths = CompletionJournal.load_completed_paths(self.journal_directory) if self.journal_directory is not None else set()
+
+        return self.completed_paths
+
+    def is_completed(self, job_path: str) -> bool:
+        """
+        Checks if the completion journal of an earlier submit records the job as successfully completed. A job whose
+        execution path has been deleted since counts as not completed, so deleting a job folder restarts the job
+        """
+        completed = self.get_completed_paths()
+        return len(completed) > 0 and os.path.abspath(job_path) in completed and os.path.exists(job_path)
+
+    def is_manifest_required(self) -> bool:
+        """
+        Checks if the manifest job order differs from the provider order, i.e. the provider cannot replace it
+        """
+        return len(self.campaigns) > 0 or self.journal_directory is not None
+
+    def get_ordered_records(self) -> Iterable[List[str]]:
+        """
+        Get the execution path and args of all jobs that are not completed in index order. The provider is evaluated
+        one package at a time
+        """
+        provider = self.get_provider()
+        count = provider.get_job_count(self.submit_args)
+        return (record
+            for start in range(0, count, self.package_size)
+            for record in provider.get_exe_args_by_job_range(self.submit_args, start, min(start + self.package_size, count))
+            if not self.is_completed(record[0]))
+
+    def write_campaigns_manifest(self, manifest_path: str) -> int:
+        campaigns = [(os.path.expandvars(x.execute_script), x.get_ordered_records()) for x in [self] + self.campaigns]
+        return JobManifest.write_campaigns(manifest_path, campaigns)
+
+    def write_manifest(self, manifest_path: str) -> int:
+        """
+        Writes the execution path and args of all jobs into a manifest that the control script reads instead of
+        evaluating the provider on every rank. Jobs that a completion journal records as completed are left out. All
+        following scripts reference the manifest
+        """
+        if len(self.campaigns) > 0:
+            written = self.write_campaigns_manifest(manifest_path)
+        else:
+            written = JobManifest.write(manifest_path, self.get_manifest_records())
+
+        self.manifest_path = manifest_path
+        self.manifest_count = written
+        self.manifest_reused = False
+        self.provider_cache_path = compile_provider(self.provide_script, self.get_provider_cache_path(manifest_path))
+        self.compiled_templates.clear()
+        return written
+
+    def get_provider_cache_path(self, manifest_path: str) -> str:
+        """
+        Get the path of the provider bytecode next to the manifest, which the control script loads instead of the source
+        """
+        return f"{os.path.splitext(manifest_path)[0]}.provider.pyc"
+
+    def get_manifest_records(self) -> Iterable[List[str]]:
+        if self.package_packing == "runtime":
+            provider = self.get_provider()
+            count = provider.get_job_count(self.submit_args)
+            order, _ = self.get_packing()
+            all_records = provider.get_exe_args_by_job_range(self.submit_args, 0, count)
+            return (all_records[i] for i in order)
+
+        return self.get_ordered_records()
+
+    def use_manifest(self, manifest_path: str) -> int:
+        """
+        Reuses an existing manifest, e.g. to resume an interrupted submit run, instead of evaluating the provider again.
+        The job count is taken from the manifest
+        """
+        with JobManifest(manifest_path) as manifest:
+            self.manifest_count = len(manifest)
+
+        self.manifest_path = manifest_path
+        self.manifest_reused = True
+        cache_path = self.get_provider_cache_path(manifest_path)
+        self.provider_cache_path = cache_path if os.path.exists(cache_path) else None
+        self.compiled_templates.clear()
+        return self.manifest_count
+
+    def get_job_count(self) -> int:
+        if self.manifest_count is not None:
+            return self.manifest_count
+
+        return sum(x.get_provider().get_job_count(x.submit_args) for x in [self] + self.campaigns)
+
+    def get_ranks_per_node(self) -> int:
+        return self.cores_per_node // (self.threads_per_job * self.jobs_per_rank)
+
+    def get_node_cookie_overrides(self, mpi_size: int) -> List[Tuple[str,str]]:
+        if self.cores_per_node is None:
+            return []
+
+        return [("nodes", str(-(-mpi_size // self.get_ranks_per_node())))]
+
+    def get_package_sizes(self, count: int) -> Iterable[int]:
+        """
+        Get the job count of each package. With a node shape, the nodes that the jobs require are spread evenly over
+        the packages and each package fills its nodes, so there is no small tail package. The free slots of the last
+        node are left in the last package. Otherwise all but the last package are full
+        """
+        if self.cores_per_node is None:
+            for start in range(0, count, self.package_size):
+                yield min(self.package_size, count - start)
+            return
+
+        node_jobs = self.get_ranks_per_node() * self.jobs_per_rank
+        node_count = -(-count // node_jobs)
+        package_count = -(-node_count // (self.package_size // node_jobs))
+        start = 0
+        for i in range(0, package_count):
+            package_nodes = node_count // package_count + (1 if i < node_count % package_count else 0)
+            yield min(package_nodes * node_jobs, count - start)
+            start += package_nodes * node_jobs
+
+    def get_package_mpi_size(self, package_size: int) -> int:
+        """
+        Get the number of MPI ranks of a package with the given number of jobs, which is smaller than the template
+        value for a tail package
+        """
+        return min(self.mpi_size, -(-package_size // self.jobs_per_rank))
+
+    def throw_if_packing_without_manifest(self) -> None:
+        if self.package_packing == "runtime" and self.manifest_path is None:
+            raise Exception("The 'runtime' packing reorders the jobs and requires a manifest")
+        if self.is_manifest_required() and self.manifest_path is None:
+            raise Exception("Merged campaigns and campaigns with a completion journal are only defined by their manifest and require one")
 
     def generate_all_scripts(self) -> Iterable[JobScript]:
-        provider = self.generate_provider()
-        count = provider.get_num_of_jobs(self.submit_args)
-        package_id = 0
-        while count > 0:
-            mpi_size = provider.get_mpi_size_by_package_id(self.submit_args, self.mpi_size, package_id)
-            yield self.generate_script(package_id, mpi_size)
-            package_id += 1
-            count -= mpi_size
+        self.throw_if_packing_without_manifest()
+        self.ensure_output_directories_created()
+        count = self.get_job_count()
+        start = 0
+        for package_id, package_size in enumerate(self.get_package_sizes(count)):
+            overrides = self.get_time_limit_overrides(start, start + package_size)
+            if self.cores_per_node is None:
+                yield self.generate_script(package_id, self.get_package_mpi_size(package_size), cookie_overrides=overrides)
+            else:
+                # Note: Evenly spread packages can be smaller than the template package, so each one passes its own range
+                yield self.generate_script(package_id, self.get_package_mpi_size(package_size), cookie_overrides=overrides, package_size=package_size, offset=start)
+            start += package_size
+
+    def generate_array_scripts(self) -> Iterable[JobScript]:
+        """
+        Generates one script for all full packages that is submitted as a SLURM job array and uses the array task id
+        as package id. A smaller tail package is generated as a separate script
+        """
+        self.throw_if_packing_without_manifest()
+        self.ensure_output_directories_created()
+        count = self.get_job_count()
+        full_count = count // self.package_size
+        tail_size = count % self.package_size
+        if full_count > 0:
+            # Note: All array tasks share one time limit, which is the one of the longest full package
+            overrides = self.get_time_limit_overrides(0, full_count * self.package_size)
+            throttle = f"%{self.submit_throttle}" if self.submit_throttle > 0 else ""
+            yield self.generate_script("$SLURM_ARRAY_TASK_ID", submit_flags=[f"--array=0-{full_count - 1}{throttle}"], cookie_overrides=overrides)
+        if tail_size > 0:
+            overrides = self.get_time_limit_overrides(count - tail_size, count)
+            yield self.generate_script(full_count, self.get_package_mpi_size(tail_size), cookie_overrides=overrides)
+
+    def generate_submit_scripts(self) -> Iterable[JobScript]:
+        if self.submit_mode == "array":
+            return self.generate_array_scripts()
+
+        return self.generate_all_scripts()
+
+    def get_provider(self) -> ProviderBase:
+        if self.provider is None:
+            self.provider = self.generate_provider()
+            self.provider.set_completed_paths(self.get_completed_paths())
+
+        return self.provider
 
     def generate_provider(self, cls_name = "Provider") -> ProviderBase: 
-        root, _ = os.path.splitext(os.path.expandvars(self.provide_script))
-        module = __import__(root)
-        return getattr(module, cls_name)(False)
+        return load_provider(self.provide_script, False, cls_name=cls_name)
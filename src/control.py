@@ -1,9 +1,85 @@
+import time
+from timing import RankTimer
+rank_timer = RankTimer()
+
 import sys
 import os
 import subprocess
-from typing import List
+import array
+import importlib
+import signal
+import threading
+from typing import Dict, Iterable, List, Set, Tuple, Union
 from provide import ProviderBase
-from mpi4py import MPI
+from manifest import JobManifest
+from journal import CompletionJournal
+from loader import load_provider
+
+# Note: Modules that only some packages need (mpi4py, runpy, shutil, traceback, concurrent.futures) are imported
+# where they are used, so they do not add to the startup of every rank
+MPI = None
+
+class ControlArgs:
+
+    """
+    The control options before '-args' and the control args behind it, parsed once from the command line. Options
+    in FLAGS have no value, all other options are followed by exactly one value
+    """
+
+    FLAGS: Set[str] = {"scatter", "dispatch", "inprocess", "requiremanifest"}
+
+    def __init__(self, argv: List[str]) -> None:
+        self.options: Dict[str,str] = dict()
+        self.flags: Set[str] = set()
+        self.args: List[str] = []
+        i = 0
+        while i < len(argv):
+            if not argv[i].startswith("-"):
+                raise Exception(f"The control option ({argv[i]}) does not start with '-'")
+            name = argv[i][1:]
+            if name == "args":
+                self.args = argv[i + 1:]
+                break
+            if name in self.FLAGS:
+                self.flags.add(name)
+                i += 1
+                continue
+            if i + 1 >= len(argv):
+                raise Exception(f"The control option ({argv[i]}) has no value")
+            self.options[name] = argv[i + 1]
+            i += 2
+
+    def has(self, name: str) -> bool:
+        return name in self.flags or name in self.options
+
+    def get(self, name: str) -> str:
+        if name not in self.options:
+            raise Exception(f"The required control option (-{name}) is missing")
+
+        return self.options[name]
+
+parsed_control_args: Union[ControlArgs,None] = None
+
+def get_parsed_control_args() -> ControlArgs:
+    global parsed_control_args
+    if parsed_control_args is None:
+        parsed_control_args = ControlArgs(sys.argv[1:])
+
+    return parsed_control_args
+
+def init_mpi() -> None:
+    """
+    Imports mpi4py, which initializes MPI, only if the package runs on more than one rank. Scripts that do not pass
+    their MPI size always import it. Single rank packages run without mpi4py, e.g. for local tests and benchmarks
+    """
+    global MPI
+    if has_control_arg("mpisize") and int(get_control_arg_value("mpisize")) < 2:
+        return
+
+    # Note: Without MPI every rank would see itself as rank 0 and run the jobs of another rank as well
+    try: from mpi4py import MPI as mpi
+    except ImportError: raise Exception("The package runs on more than one rank and requires mpi4py")
+    MPI = mpi
 
 def get_mpi_rank() -> int:
     try:
@@ -17,18 +93,17 @@ def get_mpi_size() -> int:
     except:
         return 1
 
-def get_control_arg_index(name: str) -> int:
-    return sys.argv.index(f"-{name}")
+def has_control_arg(name: str) -> bool:
+    return get_parsed_control_args().has(name)
 
 def get_control_arg_value(name: str) -> str:
-    index = get_control_arg_index(name)
-    return sys.argv[index + 1]
+    return get_parsed_control_args().get(name)
 
 def init_provider(cls_name = "Provider") -> ProviderBase: 
-    script_path = get_control_arg_value("provide") 
-    root, _ = os.path.splitext(os.path.expandvars(script_path))
-    module = __import__(root)
-    return getattr(module, cls_name)(True)
+    bytecode_path = get_control_arg_value("providecache") if has_control_arg("providecache") else None
+    provider = load_provider(get_control_arg_value("provide"), True, bytecode_path, cls_name)
+    rank_timer.mark("provider_init")
+    return provider
 
 def get_package_id() -> int:
     return int(get_control_arg_value("package"))
@@ -36,17 +111,170 @@ def get_package_id() -> int:
 def get_packsize() -> int:
     return int(get_control_arg_value("packsize"))
 
+def get_package_offset() -> Union[int,None]:
+    return int(get_control_arg_value("offset")) if has_control_arg("offset") else None
+
+def get_package_start() -> int:
+    """
+    Get the index of the first job of the package, packages of varying size pass it as offset
+    """
+    offset = get_package_offset()
+    return get_package_id() * get_packsize() if offset is None else offset
+
+def get_jobs_per_rank() -> int:
+    return int(get_control_arg_value("jobsperrank")) if has_control_arg("jobsperrank") else 1
+
 def get_control_args() -> List[str]:
-    start_index = get_control_arg_index("args") + 1
-    return sys.argv[start_index:]
+    return get_parsed_control_args().args
+
+def get_manifest_path() -> Union[str,None]:
+    if not has_control_arg("manifest"):
+        return None
+
+    path = get_control_arg_value("manifest")
+    if not os.path.exists(path) and has_control_arg("requiremanifest"):
+        raise Exception(f"The manifest ({path}) is missing and its job order cannot be reproduced by the provider")
+
+    return path if os.path.exists(path) else None
+
+def get_package_args_list() -> List[List[str]]:
+    provider = init_provider()
+    control_args = get_control_args()
+    package_id = get_package_id()
+    packsize = get_packsize()
+    return provider.get_exe_args_by_package_id(control_args, packsize, package_id, get_package_offset())
 
-def get_popen_args(mpi_rank: int) -> List[str]:
+def get_scattered_popen_args_list(mpi_rank: int) -> List[List[str]]:
+    comm = MPI.COMM_WORLD
+    jobs_per_rank = get_jobs_per_rank()
+    args_lists = None
+    if mpi_rank == 0:
+        # Note: Errors are scattered as well, otherwise all other ranks would block forever
+        try:
+            args_list = get_package_args_list()
+            args_lists = [args_list[i:i + jobs_per_rank] for i in range(0, len(args_list), jobs_per_rank)]
+        except Exception as e:
+            args_lists = [e] * comm.Get_size()
+        if len(args_lists) != comm.Get_size():
+            error = Exception(f"The package defines {len(args_list)} jobs for {comm.Get_size()} MPI ranks with {jobs_per_rank} jobs per rank")
+            args_lists = [error] * comm.Get_size()
+
+    popen_args_list = comm.scatter(args_lists, root=0)
+    if isinstance(popen_args_list, Exception):
+        raise popen_args_list
+
+    return popen_args_list
+
+def get_popen_args_list(mpi_rank: int) -> List[Tuple[int,List[str],Union[str,None]]]:
+    """
+    Get the (job index, popen args, execute script) of the jobs of this rank, which is the slice of 'jobsperrank' jobs
+    at the rank position of the package. The slice of the last rank of a tail package can be shorter. The execute
+    script is only defined by manifests of merged campaigns and is None otherwise
+    """
+    jobs_per_rank = get_jobs_per_rank()
+    start = get_package_start() + mpi_rank * jobs_per_rank
+
+    # Note: The manifest is written by the submit system, the provider is only evaluated if it is missing
+    manifest_path = get_manifest_path()
+    if manifest_path is not None:
+        with JobManifest(manifest_path) as manifest:
+            return [(i, manifest.get_record(i), manifest.get_execute_script(i)) for i in range(start, min(start + jobs_per_rank, len(manifest)))]
+
+    if has_control_arg("scatter") and get_mpi_size() > 1:
+        args_list = get_scattered_popen_args_list(mpi_rank)
+    else:
+        args_list = get_package_args_list()[mpi_rank * jobs_per_rank:(mpi_rank + 1) * jobs_per_rank]
+
+    return [(start + i, x, None) for i, x in enumerate(args_list)]
+
+class JobCounter:
+
+    """
+    Shared job counter for the dynamic dispatch mode. The counter lives in an MPI window on rank 0 and is
+    advanced with an atomic fetch and add so no rank has to act as a dedicated coordinator
+    """
+
+    def __init__(self, comm) -> None:
+        self.comm = comm
+        self.count = 0
+        self.lock = threading.Lock()
+        self.window = None
+        if comm is not None and comm.Get_size() > 1:
+            itemsize = MPI.INT64_T.Get_size()
+            self.window = MPI.Win.Allocate(itemsize if comm.Get_rank() == 0 else 0, itemsize, comm=comm)
+            if comm.Get_rank() == 0:
+                self.window.Lock(0)
+                self.window.Put([array.array("q", [0]), MPI.INT64_T], 0)
+                self.window.Unlock(0)
+            comm.Barrier()
+
+    def next(self) -> int:
+        # Note: The jobs of a rank can run in several threads, the window is only accessed by one of them at a time
+        with self.lock:
+            return self.fetch_and_increment()
+
+    def fetch_and_increment(self) -> int:
+        if self.window is None:
+            self.count += 1
+            return self.count - 1
+
+        result = array.array("q", [0])
+        self.window.Lock(0, MPI.LOCK_SHARED)
+        self.window.Fetch_and_op([array.array("q", [1]), MPI.INT64_T], [result, MPI.INT64_T], 0, 0, MPI.SUM)
+        self.window.Unlock(0)
+        return result[0]
+
+    def free(self) -> None:
+        if self.window is not None:
+            self.window.Free()
+            self.window = None
+
+def get_ordered_package_args_list() -> List[Tuple[int,List[str]]]:
     provider = init_provider()
     control_args = get_control_args()
     package_id = get_package_id()
     packsize = get_packsize()
-    args_list = provider.get_exe_args_by_package_id(control_args, packsize, package_id)
-    return args_list[mpi_rank]
+    start, stop = provider.get_package_job_range(control_args, packsize, package_id, get_package_offset())
+    args_list = list(zip(range(start, stop), provider.get_exe_args_by_job_range(control_args, start, stop)))
+
+    # Note: Longest expected jobs are dispatched first if the provider can estimate the runtimes
+    runtimes = provider.get_expected_runtimes(control_args, start, stop)
+    if runtimes is not None:
+        args_list = [x for _, x in sorted(zip(runtimes, args_list), key=lambda x: -x[0])]
+
+    return args_list
+
+def get_dispatched_popen_args(mpi_rank: int) -> Iterable[Tuple[int,List[str],Union[str,None]]]:
+    comm = MPI.COMM_WORLD if MPI is not None else None
+    packsize = get_packsize()
+    manifest_path = get_manifest_path()
+    counter = JobCounter(comm)
+
+    # Note: The counter is also freed if the consumer stops early, e.g. on a drain signal, and closes the generator
+    try:
+        if manifest_path is not None:
+            with JobManifest(manifest_path) as manifest:
+                start = get_package_start()
+                stop = min(start + packsize, len(manifest))
+                index = counter.next()
+                while start + index < stop:
+                    yield start + index, manifest.get_record(start + index), manifest.get_execute_script(start + index)
+                    index = counter.next()
+        else:
+            args_list = None
+            if mpi_rank == 0:
+                try: args_list = get_ordered_package_args_list()
+                except Exception as e: args_list = e
+            args_list = comm.bcast(args_list, root=0) if comm is not None else args_list
+            if isinstance(args_list, Exception):
+                raise args_list
+
+            index = counter.next()
+            while index < len(args_list):
+                yield args_list[index][0], args_list[index][1], None
+                index = counter.next()
+    finally:
+        counter.free()
 
 def get_script_interpreter(file_name: str) -> str:
     _,ext = os.path.splitext(file_name)
@@ -59,20 +287,264 @@ def get_script_interpreter(file_name: str) -> str:
     else:
         raise Exception(f"The script extension ({ext}) is not supported")
 
+def get_timing_directory() -> Union[str,None]:
+    if not has_control_arg("timing"):
+        return None
 
-def run_as_subprocess() -> None:
-    exe_path = get_control_arg_value("execute")
-    interpreter = get_script_interpreter(exe_path)
-    mpi_rank = get_mpi_rank()
-    mpi_size = get_mpi_size()
+    return get_control_arg_value("timing")
+
+def is_run_in_process(exe_path: str) -> bool:
+    return has_control_arg("inprocess") and os.path.splitext(exe_path)[1] == ".py"
+
+def preload_modules() -> None:
+    if not has_control_arg("preload"):
+        return
+
+    for name in get_control_arg_value("preload").split(","):
+        importlib.import_module(name)
+
+def run_python_script(script_path: str, script_args: List[str]) -> int:
+    """
+    Runs a python execute script with runpy inside the control process as '__main__'. The argv, cwd and module
+    search path are isolated per run and restored afterwards. Returns the exit code the script would have had
+    """
+    import runpy
+    import traceback
+    old_argv, old_cwd, old_path = sys.argv, os.getcwd(), sys.path.copy()
+    sys.argv = [script_path] + script_args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    try:
+        runpy.run_path(script_path, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr, flush=True)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.argv = old_argv
+        sys.path[:] = old_path
+        os.chdir(old_cwd)
+
+timing_lock = threading.Lock()
+drain_event = threading.Event()
+children_lock = threading.Lock()
+running_children: Set[subprocess.Popen] = set()
+completion_journal: Union[CompletionJournal,None] = None
+
+def handle_drain_signal(signum: int, _) -> None:
+    """
+    Stops the rank from starting further jobs and forwards the signal to the running children so they can write a
+    checkpoint before the allocation ends
+    """
+    drain_event.set()
+    # Note: The handler can interrupt a thread that holds the children lock, so it signals a lock free snapshot
+    for process in tuple(running_children):
+        process.send_signal(signum)
+
+def install_drain_handlers() -> None:
+    for signum in (signal.SIGTERM, signal.SIGUSR1):
+        signal.signal(signum, handle_drain_signal)
+
+def init_completion_journal(mpi_rank: int) -> None:
+    global completion_journal
+    if has_control_arg("journal"):
+        job_id = os.environ.get("SLURM_JOB_ID", str(os.getpid()))
+        completion_journal = CompletionJournal(get_control_arg_value("journal"), f"package_{get_package_id():05d}_rank_{mpi_rank:05d}_{job_id}")
 
+def run_child_process(popen_args: List[str]) -> int:
+    process = subprocess.Popen(popen_args)
+    with children_lock:
+        running_children.add(process)
+    try:
+        return process.wait()
+    finally:
+        with children_lock:
+            running_children.discard(process)
+
+def get_job_status(returncode: int) -> str:
+    if returncode == 0:
+        return "completed"
+
+    return "interrupted" if drain_event.is_set() else "failed"
+
+def run_popen_args(popen_args: List[str], exe_path: str, interpreter: str, mpi_rank: int, job_index: int) -> int:
+    rank_timer.mark("args_resolved")
+    mpi_info = f"MPI [{(mpi_rank + 1):03d}/ {get_mpi_size():03d}]"
     # The popen args has the execution path at index 0
-    popen_args = get_popen_args(mpi_rank)
+    job_path = popen_args[0]
     popen_args.insert(0, exe_path)
     popen_args.insert(0, interpreter)
-    mpi_info = f"MPI [{(mpi_rank + 1):03d}/ {mpi_size:03d}]"
     print(f"{mpi_info} Executing : {popen_args}", flush=True)
-    result = subprocess.run(popen_args)
-    print(f"{mpi_info} Returncode: {result.returncode}", flush=True)
+    start_time = time.monotonic()
+    # Note: The child marks are kept per job since several jobs of a rank can run at the same time
+    job_marks = {"child_start": time.time()}
+    if is_run_in_process(exe_path):
+        returncode = run_python_script(popen_args[1], popen_args[2:])
+    else:
+        returncode = run_child_process(popen_args)
+    job_marks["child_end"] = time.time()
+    runtime = time.monotonic() - start_time
+    print(f"{mpi_info} Returncode: {returncode} after {runtime:.1f} s", flush=True)
+
+    timing_directory = get_timing_directory()
+    if timing_directory is not None:
+        with timing_lock:
+            record = rank_timer.create_record(mpi_rank, get_package_id(), job_index, returncode, job_marks)
+            record["jobs_per_rank"] = get_jobs_per_rank()
+            rank_timer.append_record(timing_directory, record)
+
+    if completion_journal is not None:
+        completion_journal.append(job_path, job_index, get_job_status(returncode), returncode, runtime)
+
+    return returncode
+
+def run_jobs(jobs: Iterable[Tuple[int,List[str],Union[str,None]]], exe_path: str, interpreter: str, mpi_rank: int, stage: Union["InputStage",None]) -> Dict[int,int]:
+    """
+    Runs the (job index, popen args, execute script) of this rank with up to 'jobsperrank' concurrent jobs and returns
+    the returncode by job index. A job without its own execute script uses the one of the control args. The jobs are
+    fetched lazily by the workers, so a dispatch counter is only advanced by idle workers
+    """
+    jobs = iter(jobs)
+    jobs_lock = threading.Lock()
+    returncodes: Dict[int,int] = dict()
+
+    def run_worker() -> None:
+        while not drain_event.is_set():
+            with jobs_lock:
+                job = next(jobs, None)
+            if job is None:
+                return
+            job_index, popen_args, job_exe_path = job
+            popen_args = stage.rewrite_args(popen_args) if stage is not None else popen_args
+            if job_exe_path is None:
+                returncodes[job_index] = run_popen_args(popen_args, exe_path, interpreter, mpi_rank, job_index)
+            else:
+                job_exe_path = stage.get_local_path(job_exe_path) if stage is not None else job_exe_path
+                returncodes[job_index] = run_popen_args(popen_args, job_exe_path, get_script_interpreter(job_exe_path), mpi_rank, job_index)
+
+    # Note: In-process jobs share the interpreter state (argv, cwd) and are always run one after another
+    worker_count = 1 if has_control_arg("inprocess") else get_jobs_per_rank()
+    try:
+        if worker_count == 1:
+            run_worker()
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=worker_count) as executor:
+                for future in [executor.submit(run_worker) for _ in range(worker_count)]:
+                    future.result()
+    finally:
+        if hasattr(jobs, "close"):
+            jobs.close()
+
+    return returncodes
+
+class InputStage:
+
+    """
+    Node local copies of the execute script and the read-only inputs declared by the provider. The ranks are grouped
+    by node and one rank per node copies the files while the other ranks of the node wait for it, so the startup I/O
+    on the shared filesystem scales with the number of nodes instead of the number of ranks
+    """
+
+    def __init__(self, stage_directory: str, provider: ProviderBase, exe_path: str) -> None:
+        self.provider = provider
+        self.node_comm = MPI.COMM_WORLD.Split_type(MPI.COMM_TYPE_SHARED) if get_mpi_size() > 1 else None
+        self.is_node_root = self.node_comm is None or self.node_comm.Get_rank() == 0
+        self.directory = f"{stage_directory}/slurm-submit-{os.environ.get('SLURM_JOB_ID', os.getpid())}"
+        self.local_paths: Dict[str,str] = {x: f"{self.directory}/{i}_{os.path.basename(x)}" for i, x in enumerate(self.get_inputs(exe_path))}
+
+    def get_inputs(self, exe_path: str) -> List[str]:
+        """
+        Get the execute script and the staging inputs of the provider. The inputs are only evaluated by the node root
+        and broadcasted to the other ranks of the node
+        """
+        inputs, error = None, None
+        if self.is_node_root:
+            try: inputs = [exe_path] + self.provider.get_staging_inputs(get_control_args())
+            except Exception as e: error = e
+
+        if self.node_comm is not None:
+            inputs, error = self.node_comm.bcast((inputs, error), root=0)
+        if error is not None:
+            raise error
+
+        return inputs
+
+    def copy_inputs(self) -> None:
+        import shutil
+        error = None
+        if self.is_node_root:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                for source, target in self.local_paths.items():
+                    shutil.copy2(source, f"{target}.tmp")
+                    os.replace(f"{target}.tmp", target)
+            except Exception as e:
+                error = e
+
+        # Note: The error is broadcasted as well, otherwise a failed copy would block the other ranks of the node
+        if self.node_comm is not None:
+            error = self.node_comm.bcast(error, root=0)
+        if error is not None:
+            raise error
+
+    def get_local_path(self, path: str) -> str:
+        return self.local_paths.get(path, path)
+
+    def rewrite_args(self, popen_args: List[str]) -> List[str]:
+        return self.provider.rewrite_staged_args(popen_args, self.local_paths)
+
+    def remove(self) -> None:
+        if self.node_comm is not None:
+            self.node_comm.Barrier()
+        if self.is_node_root:
+            import shutil
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+def create_input_stage(exe_path: str) -> Union[InputStage,None]:
+    if not has_control_arg("stage"):
+        return None
+
+    stage_directory = os.path.expandvars(get_control_arg_value("stage"))
+    if "$" in stage_directory:
+        raise Exception(f"The stage directory ({stage_directory}) contains an undefined environment variable")
+
+    # Note: Every rank loads the provider for its job arg rewrite, but only the node roots evaluate the inputs
+    stage = InputStage(stage_directory, init_provider(), exe_path)
+    stage.copy_inputs()
+    return stage
+
+def run_as_subprocess() -> None:
+    exe_path = get_control_arg_value("execute")
+    interpreter = get_script_interpreter(exe_path)
+    init_mpi()
+    mpi_rank = get_mpi_rank()
+    install_drain_handlers()
+    init_completion_journal(mpi_rank)
+    preload_modules()
+    stage = create_input_stage(exe_path)
+    if stage is not None:
+        exe_path = stage.get_local_path(exe_path)
+
+    if has_control_arg("dispatch"):
+        returncodes = run_jobs(get_dispatched_popen_args(mpi_rank), exe_path, interpreter, mpi_rank, stage)
+    else:
+        returncodes = run_jobs(get_popen_args_list(mpi_rank), exe_path, interpreter, mpi_rank, stage)
+
+    if drain_event.is_set():
+        print(f"MPI [{(mpi_rank + 1):03d}/ {get_mpi_size():03d}] Received a drain signal, no further jobs were started", flush=True)
+
+    failed = sorted(x for x, code in returncodes.items() if code != 0)
+    if len(returncodes) > 1:
+        print(f"MPI [{(mpi_rank + 1):03d}/ {get_mpi_size():03d}] Finished {len(returncodes)} jobs, failed: {failed}", flush=True)
+
+    if stage is not None:
+        stage.remove()
 
-run_as_subprocess()
+if __name__ == "__main__":
+    run_as_subprocess()
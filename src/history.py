@@ -0,0 +1,38 @@
+from typing import Dict, List, Tuple, Union
+import os
+
+from journal import CompletionJournal
+
+class JobHistory:
+
+    """
+    Runtime history of the executed jobs, read from the completion journals in the journal directory. The journals are
+    the only per job record the control ranks write, so the history needs no writer of its own
+    """
+
+    def __init__(self, journal_directory: str) -> None:
+        self.directory: str = os.path.abspath(journal_directory)
+
+    def load(self) -> Dict[str,List[Tuple[float,int]]]:
+        """
+        Loads all recorded (runtime, returncode) entries by execution path
+        """
+        entries: Dict[str,List[Tuple[float,int]]] = dict()
+        for record in CompletionJournal.load_entries(self.directory):
+            entries.setdefault(record["path"], []).append((record["runtime"], record["returncode"]))
+
+        return entries
+
+    def get_predicted_runtimes(self, job_paths: List[str], is_successful_only: bool = False) -> List[Union[float,None]]:
+        """
+        Predicts the runtime of each job as the longest recorded runtime of its execution path or None if the job never ran.
+        Runs that did not finish successfully are only a lower bound of the actual runtime, they are fine for ordering
+        jobs but are left out with 'is_successful_only' for anything that must cover the whole runtime
+        """
+        entries = self.load()
+        predicted: List[Union[float,None]] = []
+        for job_path in job_paths:
+            records = [x for x in entries.get(os.path.abspath(job_path), []) if x[1] == 0 or not is_successful_only]
+            predicted.append(max(x[0] for x in records) if len(records) > 0 else None)
+
+        return predicted
@@ -1,48 +1,138 @@
-from typing import Dict, List, Tuple
+from typing import Dict, List, Set, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from provide import ProviderBase
+from jobset import JobSet
 import os
 import sqlite3
-import re
+
+class JobStatusIndex:
+
+    """
+    Persistent sidecar database next to the '.msl' file that stores the completion state of each job index together
+    with the size and mtime of its 'stdout.log'. Finished jobs are never checked again and unfinished jobs are only
+    checked again if the log has changed
+    """
+
+    def __init__(self, msl_path: str, is_readonly: bool) -> None:
+        self.path: str = f"{os.path.abspath(msl_path)}.status"
+        self.is_readonly: bool = is_readonly
+
+    def load(self) -> Dict[int,Tuple[bool,int,int]]:
+        if not os.path.exists(self.path):
+            return dict()
+
+        # Note: The connection context manager only ends the transaction, closing() closes the connection
+        try:
+            with closing(sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)) as db:
+                raw = db.execute("select JobId, IsFinished, LogSize, LogMTime from JobStatus").fetchall()
+        except sqlite3.Error as e:
+            self.print_skipped("read", e)
+            return dict()
+
+        return {int(x[0]): (bool(x[1]), int(x[2]), int(x[3])) for x in raw}
+
+    def store(self, entries: Dict[int,Tuple[bool,int,int]]) -> None:
+        if self.is_readonly or len(entries) == 0:
+            return
+
+        # Note: The index is only a cache, e.g. a read-only '.msl' directory skips it instead of failing the submit
+        try:
+            with closing(sqlite3.connect(self.path)) as db, db:
+                db.execute("create table if not exists JobStatus (JobId integer primary key, IsFinished integer, LogSize integer, LogMTime integer)")
+                db.executemany("insert or replace into JobStatus values (?,?,?,?)", [(k, int(v[0]), v[1], v[2]) for k, v in entries.items()])
+        except sqlite3.Error as e:
+            self.print_skipped("written", e)
+
+    def print_skipped(self, action: str, error: Exception) -> None:
+        if not self.is_readonly:
+            print(f"PROVIDER-INFO: The status index ({self.path}) cannot be {action} and is skipped: {error}")
 
 class Provider(ProviderBase):
 
+    # Note: The abort reason is written at the end of a simulation, so only the tail of the log is searched
+    LOG_TAIL_SIZE: int = 64 * 1024
+    SCAN_WORKER_COUNT: int = 32
+
     def __init__(self, is_silent: bool) -> None:
         super().__init__(is_silent)
-        self.incomplete_job_indices: Dict[str,List[int]] = dict()
+        self.incomplete_job_indices: Dict[str,JobSet] = dict()
+        self.job_indices: Dict[Tuple[str,...],Tuple[str,JobSet]] = dict()
+        self.existing_job_indices: Dict[str,Set[int]] = dict()
 
     def get_all_execution_args(self, control_args: List[str]) -> List[List[str]]:
-        msl_path, job_info = self.get_msl_and_job_info(control_args)
-        raw_job_indices = self.convert_job_info_to_indices(msl_path, job_info)
-        job_indices = self.get_indices_without_completed_jobs(raw_job_indices)
+        return self.get_execution_args_range(control_args, 0, self.get_job_count(control_args))
+
+    def get_all_execution_paths(self, control_args: List[str]) -> List[str]:
+        return self.get_execution_paths_range(control_args, 0, self.get_job_count(control_args))
+
+    def get_job_count(self, control_args: List[str]) -> int:
+        _, job_indices = self.get_msl_and_job_indices(control_args)
+        return len(job_indices)
+
+    def get_execution_args_range(self, control_args: List[str], start: int, stop: int) -> List[List[str]]:
+        msl_path, job_indices = self.get_msl_and_job_indices(control_args)
         pwd = os.path.abspath(os.path.curdir)
 
         exe_args: List[List[str]] = []
-        for job_index in job_indices:
-            path = self.ensure_job_path_created(pwd, job_index)
+        for job_index in job_indices[start:stop]:
+            path = self.get_job_path(pwd, job_index)
             args = self.get_startup_args_by_job_index(msl_path, path, job_index)
             exe_args.append(args)
 
         return exe_args
 
-    def get_all_execution_paths(self, control_args: List[str]) -> List[str]:
-        msl_path, job_info = self.get_msl_and_job_info(control_args)
-        raw_job_indices = self.convert_job_info_to_indices(msl_path, job_info)
-        job_indices = self.get_indices_without_completed_jobs(raw_job_indices)
+    def get_execution_paths_range(self, control_args: List[str], start: int, stop: int) -> List[str]:
+        _, job_indices = self.get_msl_and_job_indices(control_args)
         pwd = os.path.abspath(os.path.curdir)
 
         job_paths = []
-        for job_index in job_indices:
-            job_path = self.ensure_job_path_created(pwd, job_index)
+        for job_index in job_indices[start:stop]:
+            job_path = self.get_job_path(pwd, job_index)
             job_paths.append(job_path)
 
         return job_paths
 
-    def ensure_job_path_created(self, pwd: str, job_index: int) -> str:
-        path = f"{pwd}/Job{job_index:05d}"
-        if not os.path.exists(path):
-            os.mkdir(path)
-
-        return path
+    def get_staging_inputs(self, control_args: List[str]) -> List[str]:
+        return [os.path.abspath(self.get_msl_path(control_args))]
+
+    def get_msl_and_job_indices(self, control_args: List[str]) -> Tuple[str,JobSet]:
+        key = tuple(control_args)
+        if self.job_indices.get(key) is None:
+            msl_path, job_info = self.get_msl_and_job_info(control_args)
+            raw_job_indices = self.convert_job_info_to_indices(msl_path, job_info)
+            job_indices = self.get_indices_without_completed_jobs(raw_job_indices, msl_path)
+            self.create_missing_job_paths(os.path.abspath(os.path.curdir), job_indices)
+            self.job_indices[key] = (msl_path, job_indices)
+
+        return self.job_indices[key]
+
+    def get_job_path(self, pwd: str, job_index: int) -> str:
+        return f"{pwd}/Job{job_index:05d}"
+
+    def get_existing_job_indices(self, pwd: str) -> Set[int]:
+        """
+        Lists the working directory once to find the job indices that already have a job folder
+        """
+        if self.existing_job_indices.get(pwd) is None:
+            existing = set()
+            with os.scandir(pwd) as entries:
+                for entry in entries:
+                    if entry.name.startswith("Job") and entry.name[3:].isdigit() and entry.is_dir():
+                        existing.add(int(entry.name[3:]))
+            self.existing_job_indices[pwd] = existing
+
+        return self.existing_job_indices[pwd]
+
+    def create_missing_job_paths(self, pwd: str, indices: JobSet) -> None:
+        """
+        Creates the job folders of all indices that do not have one yet in a single pass
+        """
+        existing = self.get_existing_job_indices(pwd)
+        for job_index in indices:
+            if job_index not in existing:
+                os.makedirs(self.get_job_path(pwd, job_index), exist_ok=True)
+                existing.add(job_index)
 
     def throw_if_invalid_arg_count(self, control_args: List[str]) -> None:
         if len(control_args) != 2:
@@ -66,67 +156,42 @@ class Provider(ProviderBase):
             if ".msl" not in arg:
                 return arg
 
-    def convert_job_info_to_indices(self, msl_path: str, job_info: str) -> List[int]:
+    def convert_job_info_to_indices(self, msl_path: str, job_info: str) -> JobSet:
         if job_info == "All" or job_info == "all":
             return self.load_all_job_indices_from_db(msl_path)
         
-        single_re = re.compile(r"(?<![0-9\-])([0-9]+)(?![0-9\-])")
-        ranged_re = re.compile(r"([0-9]+)-([0-9]+)")
-        values = []
-        for match in single_re.finditer(job_info):
-            values.append(int(match.group(1)))
-
-        for match in ranged_re.finditer(job_info):
-            min_value = min(int(match.group(1)), int(match.group(2)))
-            max_value = max(int(match.group(1)), int(match.group(2))) + 1
-            values.extend([i for i in range(min_value, max_value)])
-
-        return sorted(set(values))
-
-    def convert_indices_to_job_info(self, indices: List[int]) -> str:
-        if len(indices) == 0:
-            return ""
-        if len(indices) == 1:
-            return str(indices[0])
-
-        result = ""
-        id_0 = indices[0]
-        id_1 = indices[0]
-        for i in indices[1:]:
-            if i == (id_1 + 1):
-                id_1 = i
-                if id_1 != indices[-1]:
-                    continue
-            if id_0 == id_1:
-                result = result + ("," if result != "" else "") + str(id_0)
-            else:
-                result = result + ("," if result != "" else "") + str(id_0) + "-" + str(id_1)
-            if id_1 != i and i == indices[-1]:
-                result = result + ("," if result != "" else "") + str(i)
-            id_0 = id_1 = i
-
-        return result
-
-    def get_indices_without_completed_jobs(self, indices: List[int]) -> List[int]:
+        return JobSet.parse(job_info)
+
+    def convert_indices_to_job_info(self, indices: Union[JobSet,List[int]]) -> str:
+        return str(indices if isinstance(indices, JobSet) else JobSet.from_indices(indices))
+
+    def get_indices_without_completed_jobs(self, indices: JobSet, msl_path: Union[str,None] = None) -> JobSet:
         job_info = self.convert_indices_to_job_info(indices)
         if self.incomplete_job_indices.get(job_info) is None:   
             pwd = os.path.abspath(os.path.curdir)
-            unfinished = []
-            finished = []
-            for i in indices:
-                dir_path = self.ensure_job_path_created(pwd, i)
-                stdout_path = f"{dir_path}/stdout.log"
-
-                if not os.path.exists(stdout_path):
-                    unfinished.append(i)
-                    continue
-
-                with open(stdout_path) as file:
-                    if "ABORT_REASON" not in file.read():
-                        unfinished.append(i)
-                        continue
-                finished.append(i)
-
+            # Note: Only the submit side writes the index, the silent control side only reads it
+            status_index = JobStatusIndex(msl_path, self.is_silent) if msl_path is not None else None
+            known_states = status_index.load() if status_index is not None else dict()
+            existing = self.get_existing_job_indices(pwd)
+            changed_states: Dict[int,Tuple[bool,int,int]] = dict()
+            # Note: Jobs that a completion journal records as completed are finished without reading their log
+            journal_completed = set(x for x in indices if x in existing and self.get_job_path(pwd, x) in self.completed_paths) if len(self.completed_paths) > 0 else set()
+            finished_indices = sorted(journal_completed)
+            scan_indices = [x for x in indices if x not in journal_completed] if len(journal_completed) > 0 else indices
+            with ThreadPoolExecutor(max_workers=self.SCAN_WORKER_COUNT) as pool:
+                states = pool.map(lambda x: self.get_job_state(pwd, x, known_states.get(x), x in existing), scan_indices)
+                for i, state in zip(scan_indices, states):
+                    if state[0]:
+                        finished_indices.append(i)
+                    # Note: A known state is also replaced if the log is gone, so a restarted job is not reported finished
+                    if state != known_states.get(i) and (state[1] >= 0 or i in known_states):
+                        changed_states[i] = state
+
+            if status_index is not None:
+                status_index.store(changed_states)
+
+            finished = JobSet.from_indices(finished_indices)
+            unfinished = indices - finished
             self.incomplete_job_indices[job_info] = unfinished
             unfinished_job_info = self.convert_indices_to_job_info(unfinished)
             finished_job_info = self.convert_indices_to_job_info(finished)
@@ -136,10 +201,41 @@ class Provider(ProviderBase):
         
         return self.incomplete_job_indices[job_info]
 
-    def load_all_job_indices_from_db(self, msl_path: str) -> List[int]:
+    def get_job_state(self, pwd: str, job_index: int, known_state: Union[Tuple[bool,int,int],None], path_exists: bool) -> Tuple[bool,int,int]:
+        """
+        Get the (is finished, log size, log mtime) state of a job. Known finished jobs are not checked again unless
+        their folder has been deleted, and the log is only read if its size or mtime differs from the known state.
+        A missing log has the size -1
+        """
+        if not path_exists:
+            return (False, -1, -1)
+        if known_state is not None and known_state[0]:
+            return known_state
+
+        stdout_path = f"{self.get_job_path(pwd, job_index)}/stdout.log"
+        try:
+            stat = os.stat(stdout_path)
+        except FileNotFoundError:
+            return (False, -1, -1)
+
+        if known_state is not None and known_state[1:] == (stat.st_size, stat.st_mtime_ns):
+            return known_state
+
+        return (self.log_contains_abort_reason(stdout_path), stat.st_size, stat.st_mtime_ns)
+
+    def log_contains_abort_reason(self, stdout_path: str) -> bool:
+        try:
+            with open(stdout_path, mode="rb") as file:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(max(0, size - self.LOG_TAIL_SIZE))
+                return b"ABORT_REASON" in file.read()
+        except FileNotFoundError:
+            return False
+
+    def load_all_job_indices_from_db(self, msl_path: str) -> JobSet:
         with sqlite3.connect(msl_path) as db:
             raw = db.cursor().execute("select Id from JobModels order by Id").fetchall()
-            return [int(x[0]) for x in raw]
+            return JobSet.from_indices(int(x[0]) for x in raw)
 
     def get_startup_args_by_job_index(self, msl_path: str, job_path: str, job_index: int) -> List[str]:
         return ["-jobId", str(job_index), "-dbPath", os.path.abspath(msl_path), "-ioPath", os.path.abspath(job_path), "-stdout", "stdout.log"]
\ No newline at end of file
@@ -0,0 +1,126 @@
+from typing import Iterable, Iterator, List, Tuple, Union
+import bisect
+import re
+
+class JobSet:
+
+    """
+    Sorted set of job indices that is stored as disjoint, non adjacent [first, last] intervals. Memory is O(ranges),
+    slicing by position and set operations work on the intervals and the canonical string form, e.g. '1-5,8,10-20',
+    can be used as a cache key
+    """
+
+    SELECTION_RE = re.compile(r"([0-9]+)(?:-([0-9]+))?")
+
+    def __init__(self, intervals: Iterable[Tuple[int,int]] = ()) -> None:
+        self.intervals: List[Tuple[int,int]] = self.merge_intervals(intervals)
+        self.offsets: List[int] = [0]
+        for first, last in self.intervals:
+            self.offsets.append(self.offsets[-1] + last - first + 1)
+
+    @classmethod
+    def merge_intervals(cls, intervals: Iterable[Tuple[int,int]]) -> List[Tuple[int,int]]:
+        merged: List[Tuple[int,int]] = []
+        for first, last in sorted((min(x), max(x)) for x in intervals):
+            if len(merged) > 0 and first <= merged[-1][1] + 1:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+            else:
+                merged.append((first, last))
+
+        return merged
+
+    @classmethod
+    def parse(cls, selection: str) -> "JobSet":
+        """
+        Parses a selection of comma separated values and ranges like '1-10,25,22-20' in any order
+        """
+        return cls((int(x.group(1)), int(x.group(2) or x.group(1))) for x in cls.SELECTION_RE.finditer(selection))
+
+    @classmethod
+    def from_indices(cls, indices: Iterable[int]) -> "JobSet":
+        intervals: List[Tuple[int,int]] = []
+        for i in sorted(indices):
+            if len(intervals) > 0 and i <= intervals[-1][1] + 1:
+                intervals[-1] = (intervals[-1][0], max(intervals[-1][1], i))
+            else:
+                intervals.append((i, i))
+
+        return cls(intervals)
+
+    def __len__(self) -> int:
+        return self.offsets[-1]
+
+    def __iter__(self) -> Iterator[int]:
+        for first, last in self.intervals:
+            yield from range(first, last + 1)
+
+    def __contains__(self, index: int) -> bool:
+        k = bisect.bisect_right(self.intervals, (index, float("inf"))) - 1
+        return k >= 0 and self.intervals[k][0] <= index <= self.intervals[k][1]
+
+    def __getitem__(self, key: Union[int,slice]) -> Union[int,"JobSet"]:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise Exception("A job set can only be sliced with a step of 1")
+            return self.slice(start, stop)
+
+        position = key + len(self) if key < 0 else key
+        if position < 0 or position >= len(self):
+            raise IndexError(f"The position ({key}) is out of the job set range")
+
+        k = bisect.bisect_right(self.offsets, position) - 1
+        return self.intervals[k][0] + position - self.offsets[k]
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, JobSet) and self.intervals == other.intervals
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.intervals))
+
+    def __str__(self) -> str:
+        return ",".join(str(x[0]) if x[0] == x[1] else f"{x[0]}-{x[1]}" for x in self.intervals)
+
+    def __repr__(self) -> str:
+        return f"JobSet('{self}')"
+
+    def __sub__(self, other: "JobSet") -> "JobSet":
+        return self.difference(other)
+
+    def __or__(self, other: "JobSet") -> "JobSet":
+        return self.union(other)
+
+    def slice(self, start: int, stop: int) -> "JobSet":
+        """
+        Get the job set of the indices at the positions [start, stop)
+        """
+        start, stop = max(0, start), min(len(self), stop)
+        if stop <= start:
+            return JobSet()
+
+        first_k = bisect.bisect_right(self.offsets, start) - 1
+        last_k = bisect.bisect_right(self.offsets, stop - 1) - 1
+        intervals = list(self.intervals[first_k:last_k + 1])
+        intervals[0] = (intervals[0][0] + start - self.offsets[first_k], intervals[0][1])
+        intervals[-1] = (intervals[-1][0], self.intervals[last_k][0] + stop - 1 - self.offsets[last_k])
+        return JobSet(intervals)
+
+    def union(self, other: "JobSet") -> "JobSet":
+        return JobSet(self.intervals + other.intervals)
+
+    def difference(self, other: "JobSet") -> "JobSet":
+        result: List[Tuple[int,int]] = []
+        k = 0
+        for first, last in self.intervals:
+            while k < len(other.intervals) and other.intervals[k][1] < first:
+                k += 1
+            j = k
+            while j < len(other.intervals) and other.intervals[j][0] <= last:
+                if other.intervals[j][0] > first:
+                    result.append((first, other.intervals[j][0] - 1))
+                first = max(first, other.intervals[j][1] + 1)
+                j += 1
+            if first <= last:
+                result.append((first, last))
+
+        return JobSet(result)
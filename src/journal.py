@@ -0,0 +1,54 @@
+from typing import Dict, Iterator, Set
+import json
+import os
+import threading
+
+class CompletionJournal:
+
+    """
+    Per rank record of the jobs a package has run with their status ('completed', 'failed' or 'interrupted'),
+    returncode and runtime. Each job appends one JSON line, so the cost of an entry does not grow with the journal and
+    a line cut off by a killed allocation only loses that entry. Entries are keyed on the absolute execution path,
+    which stays the same if the job indices change between submits
+    """
+
+    def __init__(self, directory: str, name: str) -> None:
+        self.path: str = f"{directory}/{name}.jsonl"
+        self.lock = threading.Lock()
+
+    def append(self, job_path: str, job_index: int, status: str, returncode: int, runtime: float) -> None:
+        entry = {"path": os.path.abspath(job_path), "index": job_index, "status": status, "returncode": returncode, "runtime": runtime}
+        # Note: Several jobs of a rank can finish at the same time, the file is written by one of them at a time
+        with self.lock:
+            with open(self.path, mode="a") as file:
+                file.write(json.dumps(entry) + "\n")
+
+    @classmethod
+    def load_entries(cls, directory: str) -> Iterator[Dict]:
+        """
+        Loads the entries of all journals in the directory. Unreadable files and broken lines, e.g. cut off by a killed
+        allocation, are skipped
+        """
+        if not os.path.isdir(directory):
+            return
+
+        for entry in os.scandir(directory):
+            if not entry.name.endswith(".jsonl"):
+                continue
+            try:
+                with open(entry.path) as file: lines = file.readlines()
+            except OSError:
+                continue
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                    yield {"path": str(record["path"]), "status": str(record["status"]), "returncode": int(record["returncode"]), "runtime": float(record["runtime"])}
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    @classmethod
+    def load_completed_paths(cls, directory: str) -> Set[str]:
+        """
+        Loads the execution paths of all jobs that completed successfully according to any journal in the directory
+        """
+        return set(x["path"] for x in cls.load_entries(directory) if x["status"] == "completed")
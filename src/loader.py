@@ -0,0 +1,72 @@
+from typing import Union
+import importlib.machinery
+import importlib.util
+import os
+import py_compile
+import sys
+
+from provide import ProviderBase
+
+def find_provider_script(script_path: str) -> str:
+    """
+    Get the absolute path of a provide script. Relative paths are searched on the module search path, which
+    contains the directory of the submit and control scripts
+    """
+    script_path = os.path.expandvars(script_path)
+    if os.path.isabs(script_path):
+        candidates = [script_path]
+    else:
+        candidates = [os.path.join(x or os.curdir, script_path) for x in sys.path]
+
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return os.path.abspath(candidate)
+
+    raise Exception(f"The provide script ({script_path}) cannot be found on the module search path")
+
+def get_module_name(script_path: str) -> str:
+    return os.path.splitext(os.path.basename(os.path.expandvars(script_path)))[0]
+
+def compile_provider(script_path: str, bytecode_path: str) -> str:
+    """
+    Compiles the provide script into a bytecode file that the control script loads without looking up, reading or
+    compiling the source. The bytecode is never checked against the source, so it is a snapshot of the campaign
+    """
+    py_compile.compile(find_provider_script(script_path), cfile=bytecode_path, doraise=True,
+        invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH)
+    return bytecode_path
+
+def load_provider_module(script_path: str, bytecode_path: Union[str,None] = None):
+    """
+    Loads the provide script as module that is named after the script. A precompiled bytecode file is used if it
+    exists and matches the interpreter version, otherwise the source is loaded
+    """
+    name = get_module_name(script_path)
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = None
+    if bytecode_path is not None and os.path.isfile(bytecode_path):
+        loader = importlib.machinery.SourcelessFileLoader(name, bytecode_path)
+        spec = importlib.util.spec_from_file_location(name, bytecode_path, loader=loader)
+    if spec is None:
+        spec = importlib.util.spec_from_file_location(name, find_provider_script(script_path))
+
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except ImportError:
+        # Note: The bytecode of another interpreter version has a different magic number and is rejected
+        del sys.modules[name]
+        if not isinstance(spec.loader, importlib.machinery.SourcelessFileLoader):
+            raise
+        return load_provider_module(script_path)
+    except:
+        del sys.modules[name]
+        raise
+
+    return module
+
+def load_provider(script_path: str, is_silent: bool, bytecode_path: Union[str,None] = None, cls_name: str = "Provider") -> ProviderBase:
+    return getattr(load_provider_module(script_path, bytecode_path), cls_name)(is_silent)
@@ -0,0 +1,142 @@
+from typing import Dict, Iterable, List, Tuple, Union
+import array
+import mmap
+import os
+import struct
+import sys
+
+class JobManifest:
+
+    """
+    Read-only, memory mapped view of a precomputed job manifest. The manifest stores the execution path and
+    execution args of every job so that a control script can jump directly to its own record without evaluating
+    the provider. Layout: header (magic, version, count, script count), (count + script count + 1) little endian
+    uint64 record offsets relative to the blob start, the uint32 execute script index of each job if there are
+    scripts, and the blob of records where each record is a NUL separated list of utf-8 fields. The execute scripts
+    of merged campaigns are stored as single field records behind the job records. Version 1 manifests have no
+    script count and no scripts
+    """
+
+    MAGIC: bytes = b"SSMF"
+    VERSION: int = 2
+    HEADER_FORMATS: Dict[int,str] = {1: "<4sIQ", 2: "<4sIQQ"}
+    OFFSET_SIZE: int = 8
+    SCRIPT_INDEX_SIZE: int = 4
+    FIELD_SEP: bytes = b"\0"
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.file = open(path, mode="rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from("<4sI", self.buffer, 0)
+        if magic != self.MAGIC or version not in self.HEADER_FORMATS:
+            self.close()
+            raise Exception(f"The file ({path}) is not a supported job manifest")
+
+        header_format = self.HEADER_FORMATS[version]
+        header = struct.unpack_from(header_format, self.buffer, 0)
+        self.count: int = header[2]
+        self.script_count: int = header[3] if version > 1 else 0
+        self.offsets_start: int = struct.calcsize(header_format)
+        self.script_indices_start: int = self.offsets_start + (self.count + self.script_count + 1) * self.OFFSET_SIZE
+        script_indices_size = self.count * self.SCRIPT_INDEX_SIZE if self.script_count > 0 else 0
+        self.blob_start: int = self.script_indices_start + script_indices_size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self) -> "JobManifest":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.buffer.close()
+        self.file.close()
+
+    def read_record(self, position: int) -> List[str]:
+        start, stop = struct.unpack_from("<QQ", self.buffer, self.offsets_start + position * self.OFFSET_SIZE)
+        raw = self.buffer[self.blob_start + start:self.blob_start + stop]
+        return raw.decode("utf-8").split(self.FIELD_SEP.decode("utf-8"))
+
+    def get_record(self, index: int) -> List[str]:
+        """
+        Get the execution path and execution args of the job at the given index as a single List[str]
+        """
+        if index < 0 or index >= self.count:
+            raise Exception(f"The job index ({index}) is out of the manifest range [0, {self.count})")
+
+        return self.read_record(index)
+
+    def get_execute_script(self, index: int) -> Union[str,None]:
+        """
+        Get the execute script of the job at the given index or None if the manifest does not store scripts
+        """
+        if index < 0 or index >= self.count:
+            raise Exception(f"The job index ({index}) is out of the manifest range [0, {self.count})")
+        if self.script_count == 0:
+            return None
+
+        script_index, = struct.unpack_from("<I", self.buffer, self.script_indices_start + index * self.SCRIPT_INDEX_SIZE)
+        return self.read_record(self.count + script_index)[0]
+
+    def get_records(self, start: int, stop: int) -> List[List[str]]:
+        """
+        Get the records of all jobs in the index range [start, stop)
+        """
+        return [self.get_record(i) for i in range(start, min(stop, self.count))]
+
+    @classmethod
+    def encode_record(cls, record: List[str]) -> bytes:
+        fields = [x.encode("utf-8") for x in record]
+        if len(fields) == 0 or any(map(lambda x: cls.FIELD_SEP in x, fields)):
+            raise Exception(f"The record ({record}) is empty or contains a NUL character")
+
+        return cls.FIELD_SEP.join(fields)
+
+    @classmethod
+    def write(cls, path: str, records: Iterable[List[str]]) -> int:
+        """
+        Write all records into a new manifest at the given path and return the number of records. The file is
+        written to a temporary path first and then moved in place so readers never see a partial manifest
+        """
+        return cls.write_campaigns(path, [(None, records)])
+
+    @classmethod
+    def write_campaigns(cls, path: str, campaigns: List[Tuple[Union[str,None],Iterable[List[str]]]]) -> int:
+        """
+        Write the records of several campaigns one after another into a new manifest and store the execute script of
+        each campaign for its jobs. The scripts are omitted if no campaign defines one
+        """
+        scripts = [x[0] for x in campaigns if x[0] is not None]
+        if 0 < len(scripts) < len(campaigns):
+            raise Exception("Either all or none of the manifest campaigns must define an execute script")
+
+        offsets = array.array("Q", [0])
+        script_indices = array.array("I")
+        blob = bytearray()
+        for script_index, (_, records) in enumerate(campaigns):
+            for record in records:
+                blob += cls.encode_record(record)
+                offsets.append(len(blob))
+                if len(scripts) > 0:
+                    script_indices.append(script_index)
+
+        count = len(offsets) - 1
+        for script in scripts:
+            blob += cls.encode_record([script])
+            offsets.append(len(blob))
+
+        if sys.byteorder != "little":
+            offsets.byteswap()
+            script_indices.byteswap()
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, mode="wb") as file:
+            file.write(struct.pack(cls.HEADER_FORMATS[cls.VERSION], cls.MAGIC, cls.VERSION, count, len(scripts)))
+            file.write(offsets.tobytes())
+            file.write(script_indices.tobytes())
+            file.write(blob)
+        os.replace(temp_path, path)
+        return count
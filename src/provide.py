@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import List
+from typing import Dict, List, Set, Tuple, Union
 
 class ProviderBase:
 
@@ -9,6 +9,8 @@ class ProviderBase:
 
     def __init__(self, is_silent: bool) -> None:
         self.is_silent = is_silent
+        self.cached_jobs: Dict[Tuple[str,...],Tuple[List[List[str]],List[str]]] = dict()
+        self.completed_paths: Set[str] = set()
 
     @abstractmethod
     def get_all_execution_args(self, control_args: List[str]) -> List[List[str]]:
@@ -24,47 +26,124 @@ class ProviderBase:
         execution path of the job runner at that job index
         """
 
-    def get_exe_args_by_package_id(self, control_args: List[str], max_mpi_size: int, package_id: int) -> List[List[str]]:
+    def get_cached_jobs(self, control_args: List[str]) -> Tuple[List[List[str]],List[str]]:
         """
-        Converts the List[str] arguments passed to the submit system into a List[List[str]] where each List[str]
-        is the set of arguments for the actual job runner script. Returns only the part of the list required
-        for the current job package and prepends the execution path
+        Fallback for providers that do not implement the count/range protocol. Evaluates the full execution
+        args and paths lists once per control argument set and caches the result
         """
+        key = tuple(control_args)
+        if self.cached_jobs.get(key) is None:
+            execution_args = self.get_all_execution_args(control_args)
+            execution_paths = self.get_all_execution_paths(control_args)
+            if len(execution_args) != len(execution_paths):
+                raise Exception("The length of the execution arguments and execution paths has to be equal")
+
+            self.cached_jobs[key] = (execution_args, execution_paths)
+
+        return self.cached_jobs[key]
 
-        if max_mpi_size < 1 or package_id < 0:
-            raise Exception(f"The maximum mpisize ({max_mpi_size}) or the package id ({package_id}) is invalid!")
+    def get_job_count(self, control_args: List[str]) -> int:
+        """
+        Get the total number of jobs that is defined by the control argument list. Providers that can count
+        their jobs without building all execution args should override this
+        """
+        _, execution_paths = self.get_cached_jobs(control_args)
+        return len(execution_paths)
 
-        execution_args = self.get_all_execution_args(control_args)
-        execution_paths = self.get_all_execution_paths(control_args)
+    def get_execution_args_range(self, control_args: List[str], start: int, stop: int) -> List[List[str]]:
+        """
+        Get the execution args of the jobs in the index range [start, stop). Providers that can build a part
+        of the job list lazily should override this
+        """
+        execution_args, _ = self.get_cached_jobs(control_args)
+        return [x.copy() for x in execution_args[start:stop]]
 
+    def get_execution_paths_range(self, control_args: List[str], start: int, stop: int) -> List[str]:
+        """
+        Get the execution paths of the jobs in the index range [start, stop). Providers that can build a part
+        of the job list lazily should override this
+        """
+        _, execution_paths = self.get_cached_jobs(control_args)
+        return execution_paths[start:stop]
+
+    def get_exe_args_by_job_range(self, control_args: List[str], start: int, stop: int) -> List[List[str]]:
+        """
+        Get the execution args of the jobs in the index range [start, stop) with the execution path prepended
+        """
+        execution_args = self.get_execution_args_range(control_args, start, stop)
+        execution_paths = self.get_execution_paths_range(control_args, start, stop)
         if len(execution_args) != len(execution_paths):
             raise Exception("The length of the execution arguments and execution paths has to be equal")
 
-        total_job_count = len(execution_paths)
-        min_id = package_id * max_mpi_size
-        max_id = min((package_id + 1) * max_mpi_size, total_job_count)
+        return [[path] + args for path, args in zip(execution_paths, execution_args)]
+
+    def get_staging_inputs(self, control_args: List[str]) -> List[str]:
+        """
+        Get the absolute paths of read-only input files that all jobs share and that can be copied to node local
+        storage before the jobs start. Must not require any job evaluation
+        """
+        return []
+
+    def rewrite_staged_args(self, exe_args: List[str], staged_paths: Dict[str,str]) -> List[str]:
+        """
+        Rewrites the execution args of a job to use the node local copies of the staging inputs. The default replaces
+        every argument that equals a staged input path
+        """
+        return [staged_paths.get(x, x) for x in exe_args]
+
+    def set_completed_paths(self, completed_paths: Set[str]) -> None:
+        """
+        Receives the absolute execution paths that a completion journal records as completed before any job is
+        evaluated. Providers that scan for finished jobs can skip these, the submit leaves them out in any case
+        """
+        self.completed_paths = completed_paths
+
+    def get_expected_runtimes(self, control_args: List[str], start: int, stop: int) -> Union[List[float],None]:
+        """
+        Get the expected runtimes of the jobs in the index range [start, stop) or None if the provider cannot
+        estimate them. Used to dispatch the longest jobs of a package first
+        """
+        return None
+
+    def get_package_job_range(self, control_args: List[str], max_mpi_size: int, package_id: int, offset: Union[int,None] = None) -> Tuple[int,int]:
+        """
+        Get the job index range [start, stop) that belongs to a package id for a max number of jobs per package.
+        The number of jobs per package equals the number of MPI ranks unless jobs are dispatched dynamically.
+        Packages of varying size define the index of their first job by the offset
+        """
+        if max_mpi_size < 1 or package_id < 0 or (offset is not None and offset < 0):
+            raise Exception(f"The maximum mpisize ({max_mpi_size}), the package id ({package_id}) or the offset ({offset}) is invalid!")
 
-        if max_id == min_id:
+        total_job_count = self.get_job_count(control_args)
+        min_id = package_id * max_mpi_size if offset is None else offset
+        max_id = min(min_id + max_mpi_size, total_job_count)
+
+        if max_id <= min_id:
             raise Exception("The minimal job id is equal to the maximum job id")
 
-        execution_args_part = execution_args[min_id:max_id]
-        for i, path in zip(range(0, len(execution_paths)), execution_paths[min_id:max_id]):
-            execution_args_part[i].insert(0, path)
+        return min_id, max_id
 
-        return execution_args_part
+    def get_exe_args_by_package_id(self, control_args: List[str], max_mpi_size: int, package_id: int, offset: Union[int,None] = None) -> List[List[str]]:
+        """
+        Converts the List[str] arguments passed to the submit system into a List[List[str]] where each List[str]
+        is the set of arguments for the actual job runner script. Returns only the part of the list required
+        for the current job package and prepends the execution path
+        """
+        min_id, max_id = self.get_package_job_range(control_args, max_mpi_size, package_id, offset)
+        return self.get_exe_args_by_job_range(control_args, min_id, max_id)
 
-        
     def get_mpi_size_by_package_id(self, control_args: List[str], max_mpi_size: int, package_id: int) -> int:
         """
         Get the number of MPI ranks required for a specific package id and max number of MPI ranks per job
         """
-        return len(self.get_exe_args_by_package_id(control_args, max_mpi_size, package_id))
+        min_id, max_id = self.get_package_job_range(control_args, max_mpi_size, package_id)
+        return max_id - min_id
     
     def get_num_of_jobs(self, control_args: List[str]) -> int:
         """
         Get the total number of jobs that is defined by the control argument list
         """
-        return len(self.get_all_execution_paths(control_args))
+        return self.get_job_count(control_args)
 
 class Provider(ProviderBase):
     """
@@ -80,5 +159,14 @@ class Provider(ProviderBase):
     def get_all_execution_paths(self, control_args: List[str]) -> List[str]:
         return [f"./Job{x:05d}" for x in self.get_range()]
 
+    def get_job_count(self, control_args: List[str]) -> int:
+        return len(self.get_range())
+
+    def get_execution_args_range(self, control_args: List[str], start: int, stop: int) -> List[List[str]]:
+        return [control_args.copy() for _ in self.get_range()[start:stop]]
+
+    def get_execution_paths_range(self, control_args: List[str], start: int, stop: int) -> List[str]:
+        return [f"./Job{x:05d}" for x in self.get_range()[start:stop]]
+
     def get_range(self):
         return range(1, 201)
\ No newline at end of file
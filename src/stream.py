@@ -0,0 +1,124 @@
+from typing import Dict, Iterator, List, Set, Tuple, Union
+import asyncio
+import getpass
+import itertools
+import json
+import os
+import uuid
+
+from arrayjob import ArrayJob, JobScript
+
+class StreamSubmitter:
+
+    """
+    Long running submitter that keeps at most 'MaxQueued' packages of an array job pending or running. The queue is
+    polled with the queue command (squeue by default) while the next packages are submitted as earlier ones leave the
+    queue. The progress is persisted in a state file so that a restarted submitter resumes with the same manifest
+    """
+
+    def __init__(self, job: ArrayJob) -> None:
+        self.job: ArrayJob = job
+        self.state: Dict = {"manifest": "", "next_package": 0, "active": [], "retry": []}
+        self.active_ids: Set[str] = set()
+        self.slots_changed = asyncio.Event()
+
+    def load_state(self) -> None:
+        if os.path.exists(self.job.state_path):
+            with open(self.job.state_path) as file:
+                self.state = json.load(file)
+            self.job.use_manifest(self.state["manifest"])
+            print(f"Resuming submission at package {self.state['next_package']} with {len(self.state['active'])} queued and {len(self.state.get('retry', []))} failed packages")
+        else:
+            self.job.write_manifest(f"./{uuid.uuid4()}.manifest")
+            self.state["manifest"] = os.path.abspath(self.job.manifest_path)
+            self.save_state()
+
+        self.active_ids = set(self.state["active"])
+
+    def save_state(self) -> None:
+        self.state["active"] = sorted(self.active_ids)
+        temp_path = f"{self.job.state_path}.tmp"
+        with open(temp_path, mode="w") as file:
+            json.dump(self.state, file)
+        os.replace(temp_path, self.job.state_path)
+
+    async def run_command(self, popen_args: List[str], input: Union[str,None] = None) -> str:
+        process = await asyncio.create_subprocess_exec(*popen_args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        stdout, _ = await process.communicate(input.encode("utf-8") if input is not None else None)
+        if process.returncode != 0:
+            raise Exception(f"The command ({' '.join(popen_args)}) failed with returncode {process.returncode}")
+
+        return stdout.decode("utf-8")
+
+    async def get_queued_ids(self) -> Set[str]:
+        output = await self.run_command(self.job.queue_command + ["-h", "-o", "%i", "-u", getpass.getuser()])
+        return set(x.strip() for x in output.splitlines() if x.strip() != "")
+
+    async def submit(self, script: JobScript) -> str:
+        if self.job.script_directory is not None and script.file_path is None:
+            JobScript.write_all([script], self.job.script_directory)
+        output = await self.run_command(script.get_submit_args(self.job.submit_command), script.get_submit_input())
+        return JobScript.parse_job_id(output)
+
+    async def poll(self) -> None:
+        while True:
+            # Note: A failing queue query is retried at the next poll instead of stopping the submitter
+            try: queued_ids = await self.get_queued_ids()
+            except Exception as e: print(f"Queue polling failed and is retried: {e}", flush=True)
+            else:
+                if not self.active_ids.issubset(queued_ids):
+                    self.active_ids &= queued_ids
+                    self.save_state()
+                # Note: Set after every poll so that failed submissions are retried even if no slot has been freed
+                self.slots_changed.set()
+            await asyncio.sleep(self.job.poll_interval)
+
+    async def submit_all(self, scripts: Iterator[JobScript]) -> None:
+        """
+        Submits the scripts as slots become free. Failed submissions, e.g. rejected by a submit limit, are kept in the
+        state and retried after the next poll instead of stopping the submitter
+        """
+        package_ids = itertools.count(self.state["next_package"])
+        retry: List[Tuple[int,JobScript]] = self.get_retry_scripts()
+        while True:
+            # Note: Cleared before the slots are counted so that a poll during the submission is not lost
+            self.slots_changed.clear()
+            free_slots = max(0, self.job.max_queued - len(self.active_ids))
+            batch, retry = retry[:free_slots], retry[free_slots:]
+            batch += [(i, x) for x, i in zip(itertools.islice(scripts, free_slots - len(batch)), package_ids)]
+            results = await asyncio.gather(*(self.submit(x) for _, x in batch), return_exceptions=True)
+            for (package_id, script), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    print(f"Submission of package {package_id} failed and is retried after the next poll: {result}", flush=True)
+                    retry.append((package_id, script))
+                else:
+                    print(f"Submitted package {package_id} as batch job {result}", flush=True)
+                    self.active_ids.add(result)
+            if len(batch) > 0:
+                self.state["next_package"] = max([self.state["next_package"]] + [x + 1 for x, _ in batch])
+                self.state["retry"] = sorted(x for x, _ in retry)
+                self.save_state()
+            if len(retry) == 0 and len(batch) < free_slots:
+                return
+
+            await self.slots_changed.wait()
+
+    def get_retry_scripts(self) -> List[Tuple[int,JobScript]]:
+        retry_ids = set(self.state.get("retry", []))
+        if len(retry_ids) == 0:
+            return []
+        return [(i, x) for i, x in enumerate(self.job.generate_all_scripts()) if i in retry_ids]
+
+    async def run_async(self) -> None:
+        self.load_state()
+        scripts = itertools.islice(self.job.generate_all_scripts(), self.state["next_package"], None)
+        poll_task = asyncio.create_task(self.poll())
+        try:
+            await self.submit_all(scripts)
+        finally:
+            poll_task.cancel()
+
+        print(f"All {self.state['next_package']} packages have been submitted, delete ({self.job.state_path}) before submitting a new run")
+
+    def run(self) -> None:
+        asyncio.run(self.run_async())
@@ -1,8 +1,52 @@
 import arrayjob
+import stream
 import sys
+import uuid
+
+from typing import List
+
+def split_campaign_args(argv: List[str]) -> List[List[str]]:
+    """
+    Splits the submit args 'template args... [-- template args...]' into the args of each campaign
+    """
+    campaigns = [[]]
+    for arg in argv:
+        if arg == "--":
+            campaigns.append([])
+        else:
+            campaigns[-1].append(arg)
+    if any(map(lambda x: len(x) == 0, campaigns)):
+        raise Exception("Usage: python3 submit.py template.xml [args...] [-- template.xml [args...]]...")
+
+    return campaigns
+
+def merge_campaigns(jobs: List[arrayjob.ArrayJob]) -> List[arrayjob.ArrayJob]:
+    """
+    Merges campaigns with the same batch and package settings so that their jobs share packages
+    """
+    merged = []
+    for job in jobs:
+        target = next((x for x in merged if job.get_merge_key() is not None and x.get_merge_key() == job.get_merge_key()), None)
+        if target is None:
+            merged.append(job)
+        else:
+            target.merge(job)
+
+    return merged
 
 print(f"Submit script called with args: {sys.argv[1:]}")
 
-job = arrayjob.ArrayJob(sys.argv[1], sys.argv[2:])
-for script in job.generate_all_scripts():
-    script.submit(auto_delete=True)
\ No newline at end of file
+jobs = [arrayjob.ArrayJob(x[0], x[1:]) for x in split_campaign_args(sys.argv[1:])]
+for job in merge_campaigns(jobs):
+    if job.submit_mode == "stream":
+        stream.StreamSubmitter(job).run()
+        continue
+
+    job.write_manifest(f"./{uuid.uuid4()}.manifest")
+    scripts = job.generate_submit_scripts()
+    if job.script_directory is not None:
+        scripts = arrayjob.JobScript.write_all(scripts, job.script_directory)
+
+    for script in scripts:
+        job_id = script.submit(submit_command=job.submit_command)
+        print(f"Submitted batch job {job_id}")
@@ -0,0 +1,138 @@
+from typing import Dict, List
+import json
+import os
+import resource
+import sys
+import time
+
+def get_process_start_time() -> float:
+    """
+    Get the wall clock time at which the interpreter process was started. Falls back to the current time if the
+    start time cannot be read from procfs
+    """
+    try:
+        with open("/proc/self/stat") as file:
+            # Note: The command name can contain spaces, field 22 (start time in clock ticks after boot) is counted after it
+            start_ticks = int(file.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as file:
+            uptime = float(file.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except:
+        return time.time()
+
+class RankTimer:
+
+    """
+    Collects wall clock timestamps of the startup phases of a control rank and writes one JSON line per executed job
+    into a per rank timing file '<directory>/package_<id>_rank_<rank>_<job id>.jsonl'. The SLURM job id tells the
+    packages of different submits apart, which reuse the package ids of their manifest
+    """
+
+    def __init__(self) -> None:
+        self.marks: Dict[str,float] = {"interpreter_start": get_process_start_time(), "control_start": time.time()}
+        self.rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    def mark(self, name: str) -> None:
+        self.marks[name] = time.time()
+
+    def create_record(self, rank: int, package_id: int, job_index: int, returncode: int, job_marks: Dict[str,float]) -> Dict:
+        """
+        Creates the record of the last executed job with the rank marks and the marks of the job. The CPU times are
+        the difference to the previous record of this rank, which includes concurrently running jobs of the rank. The
+        max RSS is the maximum over all jobs of this rank
+        """
+        rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        record = {
+            "job_id": os.environ.get("SLURM_JOB_ID", ""),
+            "host": os.uname().nodename,
+            "rank": rank,
+            "package": package_id,
+            "job_index": job_index,
+            "returncode": returncode,
+            "max_rss_kib": rusage.ru_maxrss,
+            "user_cpu_s": rusage.ru_utime - self.rusage.ru_utime,
+            "sys_cpu_s": rusage.ru_stime - self.rusage.ru_stime}
+        record.update(self.marks)
+        record.update(job_marks)
+        self.rusage = rusage
+        return record
+
+    def append_record(self, directory: str, record: Dict) -> None:
+        # Note: Every rank writes its own file, appends from several nodes to one file can interleave on NFS
+        path = f"{directory}/package_{record['package']:05d}_rank_{record['rank']:05d}_{record['job_id'] or os.getpid()}.jsonl"
+        with open(path, mode="a") as file:
+            file.write(json.dumps(record) + "\n")
+
+def load_records(directory: str) -> List[Dict]:
+    records = []
+    for entry in sorted(os.scandir(directory), key=lambda x: x.name):
+        if not entry.name.startswith("package_") or not entry.name.endswith(".jsonl"):
+            continue
+        with open(entry.path) as file:
+            for line in file:
+                try: records.append(json.loads(line))
+                except json.JSONDecodeError: continue
+
+    return records
+
+def get_distribution(values: List[float]) -> Dict:
+    # Note: Imported here since the control script imports this module on every rank but only the summary needs it
+    import statistics
+    if len(values) == 0:
+        return {"count": 0}
+
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "min": ordered[0],
+        "mean": statistics.mean(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max": ordered[-1]}
+
+def summarize(records: List[Dict]) -> Dict:
+    """
+    Summarizes the timing records of a campaign into the startup overhead (interpreter start to first child start of
+    each rank), the job runtime distribution and the idle core hours, i.e. the time each rank of a package held its
+    core without running a job while the package was still running. Each rank is assumed to hold one core per
+    concurrently running job ('jobs_per_rank'). Packages are told apart by their SLURM job id and package id
+    """
+    ranks: Dict[tuple,List[Dict]] = dict()
+    for record in records:
+        ranks.setdefault((record.get("job_id", ""), record["package"], record["host"], record["rank"]), []).append(record)
+
+    packages: Dict[tuple,List[float]] = dict()
+    for (job_id, package_id, _, _), rank_records in ranks.items():
+        span = packages.setdefault((job_id, package_id), [float("inf"), float("-inf")])
+        span[0] = min(span[0], min(x["interpreter_start"] for x in rank_records))
+        span[1] = max(span[1], max(x["child_end"] for x in rank_records))
+
+    startup = []
+    resolve = []
+    idle_seconds = 0.0
+    allocated_seconds = 0.0
+    for (job_id, package_id, _, _), rank_records in ranks.items():
+        cores = rank_records[0].get("jobs_per_rank", 1)
+        span = packages[(job_id, package_id)][1] - packages[(job_id, package_id)][0]
+        startup.append(min(x["child_start"] for x in rank_records) - min(x["interpreter_start"] for x in rank_records))
+        resolve.append(min(x["args_resolved"] for x in rank_records) - min(x["control_start"] for x in rank_records))
+        busy = sum(x["child_end"] - x["child_start"] for x in rank_records)
+        idle_seconds += span * cores - busy
+        allocated_seconds += span * cores
+
+    return {
+        "packages": len(packages),
+        "ranks": len(ranks),
+        "jobs": len(records),
+        "failed_jobs": sum(1 for x in records if x["returncode"] != 0),
+        "startup_overhead_s": get_distribution(startup),
+        "args_resolve_s": get_distribution(resolve),
+        "job_runtime_s": get_distribution([x["child_end"] - x["child_start"] for x in records]),
+        "idle_core_hours": idle_seconds / 3600.0,
+        "allocated_core_hours": allocated_seconds / 3600.0}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        raise Exception("Usage: python3 timing.py <timing directory>")
+
+    print(json.dumps(summarize(load_records(sys.argv[1])), indent=2))
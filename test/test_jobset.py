@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from jobset import JobSet
+
+class JobSetTest(unittest.TestCase):
+
+    def test_parse_merges_unordered_and_overlapping_ranges(self) -> None:
+        jobs = JobSet.parse("8,1-5,22-20,4-6")
+        self.assertEqual(str(jobs), "1-6,8,20-22")
+        self.assertEqual(len(jobs), 10)
+        self.assertEqual(list(jobs), [1, 2, 3, 4, 5, 6, 8, 20, 21, 22])
+
+    def test_parse_matches_from_indices(self) -> None:
+        self.assertEqual(JobSet.parse("1-3,5"), JobSet.from_indices([5, 3, 1, 2]))
+        self.assertEqual(len(JobSet.parse("")), 0)
+
+    def test_position_access(self) -> None:
+        jobs = JobSet.parse("1-3,10-12")
+        self.assertEqual(jobs[0], 1)
+        self.assertEqual(jobs[3], 10)
+        self.assertEqual(jobs[-1], 12)
+        self.assertRaises(IndexError, lambda: jobs[6])
+        self.assertIn(11, jobs)
+        self.assertNotIn(5, jobs)
+
+    def test_slice_across_intervals(self) -> None:
+        jobs = JobSet.parse("1-3,10-12,20")
+        self.assertEqual(str(jobs.slice(2, 5)), "3,10-11")
+        self.assertEqual(str(jobs[1:]), "2-3,10-12,20")
+        self.assertEqual(str(jobs[4:4]), "")
+        self.assertEqual(list(jobs[2:6]), list(jobs)[2:6])
+        self.assertRaises(Exception, lambda: jobs[::2])
+
+    def test_difference(self) -> None:
+        jobs = JobSet.parse("1-10,20-30")
+        self.assertEqual(str(jobs - JobSet.parse("3-4,9-21,30")), "1-2,5-8,22-29")
+        self.assertEqual(str(jobs - JobSet.parse("0-40")), "")
+        self.assertEqual(jobs - JobSet(), jobs)
+        self.assertEqual(set(jobs - JobSet.parse("5,25")), set(jobs) - {5, 25})
+
+    def test_union(self) -> None:
+        self.assertEqual(str(JobSet.parse("1-3") | JobSet.parse("4,6")), "1-4,6")
+
+if __name__ == "__main__":
+    unittest.main()
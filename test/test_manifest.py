@@ -0,0 +1,58 @@
+import os
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from manifest import JobManifest
+
+class JobManifestTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = f"{self.directory.name}/jobs.manifest"
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_write_read_round_trip(self) -> None:
+        records = [["/jobs/0", "-n", "1"], ["/jobs/1", "-n", "2"], ["/jobs/ä"]]
+        self.assertEqual(JobManifest.write(self.path, records), 3)
+        with JobManifest(self.path) as manifest:
+            self.assertEqual(len(manifest), 3)
+            self.assertEqual(manifest.get_records(0, 10), records)
+            self.assertIsNone(manifest.get_execute_script(1))
+            self.assertRaises(Exception, lambda: manifest.get_record(3))
+        self.assertFalse(os.path.exists(f"{self.path}.tmp"))
+
+    def test_campaigns_round_trip(self) -> None:
+        campaigns = [("/a/run.sh", [["/a/0"], ["/a/1", "x"]]), ("/b/run.py", [["/b/0", "y"]])]
+        self.assertEqual(JobManifest.write_campaigns(self.path, campaigns), 3)
+        with JobManifest(self.path) as manifest:
+            self.assertEqual(manifest.get_records(0, 3), [["/a/0"], ["/a/1", "x"], ["/b/0", "y"]])
+            self.assertEqual([manifest.get_execute_script(i) for i in range(3)], ["/a/run.sh", "/a/run.sh", "/b/run.py"])
+
+    def test_campaigns_require_all_or_no_scripts(self) -> None:
+        self.assertRaises(Exception, lambda: JobManifest.write_campaigns(self.path, [("/a/run.sh", [["/a/0"]]), (None, [["/b/0"]])]))
+
+    def test_read_version_1(self) -> None:
+        records = [b"/jobs/0\0-n\0001", b"/jobs/1"]
+        offsets = [0, len(records[0]), len(records[0]) + len(records[1])]
+        with open(self.path, mode="wb") as file:
+            file.write(struct.pack("<4sIQ", JobManifest.MAGIC, 1, len(records)))
+            file.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+            file.write(b"".join(records))
+        with JobManifest(self.path) as manifest:
+            self.assertEqual(len(manifest), 2)
+            self.assertEqual(manifest.get_records(0, 2), [["/jobs/0", "-n", "1"], ["/jobs/1"]])
+            self.assertIsNone(manifest.get_execute_script(0))
+
+    def test_reject_unknown_file(self) -> None:
+        with open(self.path, mode="wb") as file:
+            file.write(struct.pack("<4sIQ", b"XXXX", 1, 0))
+        self.assertRaises(Exception, lambda: JobManifest(self.path))
+
+if __name__ == "__main__":
+    unittest.main()